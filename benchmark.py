@@ -0,0 +1,407 @@
+"""
+Benchmarks for the layout and extraction hot paths.
+
+Synthetic PV-style meeting records are generated with fitz (a cover page with
+President/Members/Agenda, two-column speech pages with many speaker turns and
+dense annex tables), so no downloaded PDFs are needed. Every benchmark reports
+its throughput (pages/s, speeches/s, ...) and, in a separate run in a forked
+process, how far it raised the peak RSS (MuPDF's C heap included). Results are written as JSON and can be
+compared against an earlier run to flag regressions:
+
+    python benchmark.py --output bench_before.json
+    python benchmark.py --output bench_after.json --compare bench_before.json
+
+`--verify-template` checks on a sample of real PDFs that the template fast
+path for two-column pages lays them out exactly like column_boxes:
+
+    python benchmark.py --verify-template source --sample 50
+"""
+from datetime import datetime
+from pathlib import Path
+from typing import Callable
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import fitz
+from extract import extract_metadata, process_doc, split_text_by_speakers
+from multi_column import (
+    FOOTER_MARGIN,
+    HEADER_MARGIN,
+    column_boxes,
+    get_blocks,
+    get_clip,
+    get_page_text,
+    get_pages,
+    template_boxes,
+)
+from memory import get_rss
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BENCHMARK_FILE = "benchmark.json"
+REGRESSION_THRESHOLD = 0.1  # Flag throughput drops of more than 10%
+
+WORDS = (
+    "security council resolution peace humanitarian situation members "
+    "delegation support international cooperation ceasefire civilians region "
+    "dialogue sanctions mandate mission report"
+).split()
+MEMBERS = [
+    ("Albania", "Mr. Hoxha"),
+    ("Brazil", "Mr. De Almeida Filho"),
+    ("China", "Mr. Zhang Jun"),
+    ("Ecuador", "Mr. Montalvo Sosa"),
+    ("France", "Mr. De Rivière"),
+    ("Gabon", "Ms. Koumby Missambo"),
+    ("Ghana", "Mr. Agyeman"),
+    ("Malta", "Mrs. Frazier"),
+    ("Mozambique", "Mr. Afonso"),
+    ("Switzerland", "Mrs. Baeriswyl"),
+    ("United States of America", "Mrs. Thomas-Greenfield"),
+]
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842
+COLUMNS_X = (56, 305)
+COLUMN_WIDTH = 234
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def _add_page_furniture(page, meeting_number: int, page_number: int) -> None:
+    """Header and footer lines, which the layout margins should skip."""
+    page.insert_text((72, 60), f"S/PV.{meeting_number}", fontsize=9)
+    page.insert_text((450, 60), "19/03/2024", fontsize=9)
+    page.insert_text((72, 800), f"{page_number}", fontsize=9)
+
+
+def _add_cover_page(doc, meeting_number: int) -> None:
+    page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+    y = 100
+    for line in [
+        f"United Nations S/PV.{meeting_number}",
+        "Security Council",
+        "Seventy-ninth year",
+        f"{meeting_number}th meeting",
+        "Tuesday, 19 March 2024, 3.10 p.m.",
+        "New York",
+    ]:
+        page.insert_text((72, y), line, fontsize=11)
+        y += 16
+
+    page.insert_text((72, y + 10), "President:", fontsize=10)
+    page.insert_text((250, y + 10), "Mr. Yamazaki . . . . . . (Japan)", fontsize=10)
+    y += 30
+    page.insert_text((72, y), "Members:", fontsize=10)
+    for country, person in MEMBERS:
+        page.insert_text((250, y), f"{country} . . . . . . . {person}", fontsize=10)
+        y += 13
+
+    page.insert_text((72, y + 10), "Agenda", fontsize=10)
+    page.insert_text(
+        (72, y + 26), "Maintenance of international peace and security", fontsize=10
+    )
+    page.insert_text(
+        (72, y + 66),
+        "This record contains the text of speeches delivered in English.",
+        fontsize=8,
+    )
+
+
+def _add_speech_page(doc, rng: random.Random, meeting_number: int) -> int:
+    """Add a two-column page of speeches, returning the number of turns."""
+    page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+    _add_page_furniture(page, meeting_number, doc.page_count)
+    speakers = ["The President"] + [f"{p} ({c})" for c, p in MEMBERS]
+    turns = 0
+
+    for x0 in COLUMNS_X:
+        text = ""
+        for _ in range(3):
+            language = " (spoke in French)" if rng.random() < 0.2 else ""
+            text += f"{rng.choice(speakers)}{language}: "
+            text += f"{_sentence(rng, rng.randint(15, 30))}\n"
+            turns += 1
+        rect = fitz.Rect(x0, 100, x0 + COLUMN_WIDTH, 760)
+        if page.insert_textbox(rect, text, fontsize=10) < 0:
+            raise ValueError("Synthetic speeches do not fit the column")
+
+    return turns
+
+
+def _add_table_page(doc, rng: random.Random, meeting_number: int) -> None:
+    """Add a dense annex table, e.g. a vote breakdown."""
+    page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+    _add_page_furniture(page, meeting_number, doc.page_count)
+    cells = ["In favour", "Against", "Abstaining", "Yes", "No", "12", "3", "..."]
+    columns, rows = 6, 50
+
+    for row in range(rows):
+        y = 100 + row * 650 / rows
+        page.insert_text((56, y), rng.choice(MEMBERS)[0], fontsize=7)
+        for column in range(1, columns):
+            x = 56 + column * 480 / columns
+            page.insert_text((x, y), rng.choice(cells), fontsize=7)
+
+
+def make_pv_doc(
+    seed: int = 0,
+    speech_pages: int = 40,
+    table_pages: int = 4,
+    meeting_number: int = 9000,
+) -> tuple[fitz.Document, int]:
+    """Generate a meeting record in memory, returning it and its speaker turns."""
+    rng = random.Random(seed)
+    doc = fitz.open()
+    _add_cover_page(doc, meeting_number)
+    turns = sum(_add_speech_page(doc, rng, meeting_number) for _ in range(speech_pages))
+    for _ in range(table_pages):
+        _add_table_page(doc, rng, meeting_number)
+
+    # Reopen from bytes, so pages are parsed like those of a downloaded PDF
+    return fitz.open("pdf", doc.tobytes()), turns
+
+
+def measure_peak_rss(function: Callable[[], int]) -> int | None:
+    """Growth of the peak RSS during one run of `function`, in a forked process.
+
+    The child starts at the RSS of this process, so earlier runs do not mask
+    the growth. Returns None where RSS or fork are not available.
+    """
+    if resource is None or get_rss() is None:
+        return None
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            os.close(read_fd)
+            start = get_rss()
+            function()
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # KiB
+            os.write(write_fd, str(peak - start).encode())
+            status = 0
+        finally:
+            os._exit(status)
+
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        output = f.read()
+    _, status = os.waitpid(pid, 0)
+    if status != 0:
+        raise RuntimeError(f"Peak RSS run failed with status {status}")
+    return int(output)
+
+
+def measure(function: Callable[[], int], repeat: int) -> dict:
+    """Best time of `repeat` runs and the peak RSS growth of one more run.
+
+    `function` returns the number of items (pages, speeches, ...) processed.
+    """
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        items = function()
+        seconds.append(time.perf_counter() - start)
+
+    best = min(seconds)
+    return {
+        "items": items,
+        "seconds": best,
+        "throughput": items / best if best else 0.0,
+        "peak_rss_bytes": measure_peak_rss(function),
+    }
+
+
+def run_benchmarks(
+    docs: int = 3,
+    speech_pages: int = 40,
+    table_pages: int = 4,
+    repeat: int = 3,
+    seed: int = 0,
+) -> dict:
+    generated = [
+        make_pv_doc(seed + i, speech_pages, table_pages, 9000 + i) for i in range(docs)
+    ]
+    documents = [doc for doc, _ in generated]
+    # Inputs of the text stages, laid out once up front
+    pages = [get_pages(doc) for doc in documents]
+    texts = ["".join("".join(page) for page in doc_pages[1:]) for doc_pages in pages]
+    page_count = sum(doc.page_count for doc in documents)
+
+    def bench_column_boxes():
+        for doc in documents:
+            for page in doc:
+                column_boxes(page, FOOTER_MARGIN, HEADER_MARGIN, no_image_text=True)
+        return page_count
+
+    def bench_get_pages(template=True, single_pass=False):
+        for doc in documents:
+            get_pages(doc, template=template, single_pass=single_pass)
+        return page_count
+
+    def bench_extract_metadata():
+        for doc_pages in pages:
+            extract_metadata(doc_pages[0])
+        return len(pages)
+
+    def bench_split_text_by_speakers():
+        return sum(len(split_text_by_speakers(text)) for text in texts)
+
+    def bench_process_doc():
+        for doc in documents:
+            process_doc(doc)
+        return page_count
+
+    benchmarks = {
+        "column_boxes": ("pages", bench_column_boxes),
+        "get_pages": ("pages", bench_get_pages),
+        "get_pages_no_template": ("pages", lambda: bench_get_pages(template=False)),
+        "get_pages_single_pass": ("pages", lambda: bench_get_pages(single_pass=True)),
+        "extract_metadata": ("documents", bench_extract_metadata),
+        "split_text_by_speakers": ("speeches", bench_split_text_by_speakers),
+        "process_doc": ("pages", bench_process_doc),
+    }
+
+    results = {}
+    for name, (unit, function) in benchmarks.items():
+        results[name] = {"unit": unit, **measure(function, repeat)}
+        peak = results[name]["peak_rss_bytes"]
+        print(
+            f"{name:<24} {results[name]['throughput']:>10.1f} {unit}/s "
+            + (f"{peak / 1024**2:>8.1f} MiB peak RSS" if peak is not None else "")
+        )
+
+    return {
+        "meta": {
+            "commit": _get_commit(),
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pymupdf": fitz.VersionBind,
+            "docs": docs,
+            "pages": page_count,
+            "speaker_turns": sum(turns for _, turns in generated),
+            "repeat": repeat,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def verify_template(paths: list[str | Path]) -> dict:
+    """Lay out PDFs with and without the template fast path and compare.
+
+    Returns the pages laid out, how many fell back to column_boxes and the
+    pages ("file:page") whose text differs between the two paths.
+    """
+    pages = fallbacks = 0
+    mismatches = []
+    for path in paths:
+        with fitz.open(path) as doc:
+            for page in doc:
+                blocks = get_blocks(page, get_clip(page, FOOTER_MARGIN, HEADER_MARGIN))
+                pages += 1
+                fallbacks += template_boxes(page, blocks) is None
+                fast = get_page_text(page)
+                slow = get_page_text(page, template=False)
+                if fast != slow:
+                    mismatches.append(f"{Path(path).name}:{page.number}")
+
+    return {"pages": pages, "fallbacks": fallbacks, "mismatches": mismatches}
+
+
+def _get_commit() -> str | None:
+    try:
+        output = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).parent,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.stdout.strip()
+
+
+def compare(
+    current: dict, baseline: dict, threshold: float = REGRESSION_THRESHOLD
+) -> list[str]:
+    """Return the benchmarks whose throughput fell by more than `threshold`."""
+    regressions = []
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if not before or not before["throughput"]:
+            continue
+
+        change = result["throughput"] / before["throughput"] - 1
+        print(f"{name:<24} {change:>+8.1%} vs {baseline['meta'].get('commit')}")
+        if change < -threshold:
+            regressions.append(name)
+
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark layout and extraction")
+    parser.add_argument("--output", default=BENCHMARK_FILE, help="Results file")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=REGRESSION_THRESHOLD,
+        help="Relative throughput drop reported as a regression",
+    )
+    parser.add_argument("--docs", type=int, default=3, help="Synthetic documents")
+    parser.add_argument(
+        "--speech-pages", type=int, default=40, help="Speech pages per document"
+    )
+    parser.add_argument(
+        "--table-pages", type=int, default=4, help="Annex table pages per document"
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--verify-template",
+        metavar="FOLDER",
+        help="Instead, check the template fast path against column_boxes on PDFs",
+    )
+    parser.add_argument(
+        "--sample", type=int, default=50, help="PDFs sampled by --verify-template"
+    )
+    args = parser.parse_args()
+
+    if args.verify_template:
+        paths = sorted(Path(args.verify_template).glob("*.pdf"))
+        paths = random.Random(args.seed).sample(paths, min(args.sample, len(paths)))
+        report = verify_template(paths)
+        print(
+            f"{report['pages']} pages in {len(paths)} PDFs, "
+            f"{report['fallbacks'] / max(report['pages'], 1):.1%} fell back "
+            f"to column_boxes, {len(report['mismatches'])} differ"
+        )
+        for page in report["mismatches"]:
+            print(f"Differs: {page}")
+        sys.exit(1 if report["mismatches"] else 0)
+
+    current = run_benchmarks(
+        args.docs, args.speech_pages, args.table_pages, args.repeat, args.seed
+    )
+    Path(args.output).write_text(json.dumps(current, indent=4))
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        regressions = compare(current, baseline, args.threshold)
+        if regressions:
+            print(f"Regressions beyond {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
@@ -0,0 +1,118 @@
+"""
+Top-k similarity search over ubinary embeddings (see llm.get_embedding).
+
+Packed binary vectors are compared by Hamming distance: XOR with the query
+and count the set bits, vectorised over the whole index with NumPy. The
+closest candidates can then be rescored with their float vectors, which
+restores most of the accuracy lost by quantization.
+"""
+from pathlib import Path
+import numpy as np
+from embedding_store import EmbeddingStore
+
+CODES_FILE = "codes.npy"
+IDS_FILE = "ids.npy"
+FLOATS_FILE = "floats.npy"
+RESCORE_MULTIPLIER = 4  # Candidates rescored per requested result
+
+# Set bits of every byte value, used if np.bitwise_count is unavailable
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _as_words(codes: np.ndarray) -> np.ndarray:
+    """View packed codes as uint64 words if their width allows it."""
+    if codes.shape[-1] % 8 == 0 and codes.flags.c_contiguous:
+        return codes.view(np.uint64)
+    return codes
+
+
+def hamming_distances(codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """Hamming distance between every row of `codes` and the packed `query`."""
+    xor = np.bitwise_xor(_as_words(codes), _as_words(np.ascontiguousarray(query)))
+
+    if hasattr(np, "bitwise_count"):  # NumPy >= 2.0
+        return np.bitwise_count(xor).sum(axis=1, dtype=np.uint32)
+
+    return _POPCOUNT[xor.view(np.uint8)].sum(axis=1, dtype=np.uint32)
+
+
+def _top_k(values: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k smallest values, sorted ascending."""
+    k = min(k, len(values))
+    if k == 0:
+        return np.empty(0, dtype=np.intp)
+
+    top = np.argpartition(values, k - 1)[:k]
+    return top[np.argsort(values[top], kind="stable")]
+
+
+class BinaryIndex:
+    def __init__(
+        self,
+        codes: np.ndarray,
+        ids: np.ndarray | None = None,
+        floats: np.ndarray | None = None,
+    ):
+        self.codes = np.ascontiguousarray(codes, dtype=np.uint8)
+        self.ids = np.arange(len(codes)) if ids is None else np.asarray(ids)
+        self.floats = floats
+
+    @classmethod
+    def from_store(cls, store: EmbeddingStore, ids=None) -> "BinaryIndex":
+        """Index every embedding of `store`, ids default to the store rows."""
+        return cls(store.binary, ids, store.floats)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def search(
+        self,
+        query: np.ndarray,
+        k: int = 10,
+        query_float: np.ndarray | None = None,
+        rescore_multiplier: int = RESCORE_MULTIPLIER,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Return the ids and scores of the `k` vectors closest to `query`.
+
+        Without `query_float` the scores are Hamming distances (lower is
+        closer). With `query_float`, and floats stored in the index, the
+        `k * rescore_multiplier` closest codes are rescored by cosine
+        similarity (higher is closer).
+        """
+        rescore = query_float is not None and self.floats is not None
+        candidates = k * rescore_multiplier if rescore else k
+
+        distances = hamming_distances(self.codes, query)
+        top = _top_k(distances, candidates)
+
+        if not rescore:
+            return self.ids[top], distances[top]
+
+        # Sorted rows keep the reads from a memory map sequential
+        top = np.sort(top)
+        vectors = np.asarray(self.floats[top], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query_float)
+        similarities = vectors @ query_float / np.maximum(norms, 1e-12)
+
+        best = _top_k(-similarities, k)
+        return self.ids[top[best]], similarities[best]
+
+    def save(self, folder: str | Path) -> None:
+        folder = Path(folder)
+        folder.mkdir(parents=True, exist_ok=True)
+        np.save(folder / CODES_FILE, self.codes)
+        np.save(folder / IDS_FILE, self.ids)
+        if self.floats is not None:
+            np.save(folder / FLOATS_FILE, np.asarray(self.floats, dtype=np.float32))
+
+    @classmethod
+    def load(cls, folder: str | Path, mmap: bool = True) -> "BinaryIndex":
+        """Load a saved index, memory-mapping its arrays unless mmap=False."""
+        folder = Path(folder)
+        mmap_mode = "r" if mmap else None
+        codes = np.load(folder / CODES_FILE, mmap_mode=mmap_mode)
+        ids = np.load(folder / IDS_FILE, mmap_mode=mmap_mode)
+        floats = None
+        if (folder / FLOATS_FILE).exists():
+            floats = np.load(folder / FLOATS_FILE, mmap_mode=mmap_mode)
+        return cls(codes, ids, floats)
@@ -0,0 +1,70 @@
+"""
+Size-bounded on-disk cache used to skip repeated work during extraction.
+
+Values are pickled into one file per key. Reads refresh a file's mtime, and
+once the folder grows beyond `max_bytes` the least recently used entries are
+deleted. Writes go through a temporary file and `os.replace`, so several
+extraction processes can share one cache folder.
+"""
+from pathlib import Path
+import os
+import pickle
+import tempfile
+
+CACHE_FOLDER = ".cache"
+
+
+class DiskCache:
+    def __init__(self, folder: str | Path, max_bytes: int):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._size = sum(path.stat().st_size for path in self._entries())
+
+    def _entries(self) -> list[Path]:
+        return list(self.folder.glob("*/*.pickle"))
+
+    def _path(self, key: str) -> Path:
+        return self.folder / key[:2] / f"{key}.pickle"
+
+    def get(self, key: str, default=None):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+            os.utime(path)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return default
+        return value
+
+    def set(self, key: str, value) -> None:
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+        self._size += path.stat().st_size
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def evict(self) -> None:
+        """Delete least recently used entries until the cache fits `max_bytes`."""
+        entries = []
+        for path in self._entries():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue  # Evicted by another process
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        entries.sort()
+        self._size = sum(size for _, size, _ in entries)
+
+        for _, size, path in entries:
+            if self._size <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            self._size -= size
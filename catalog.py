@@ -0,0 +1,255 @@
+"""
+Indexed catalog of meetings, kept in SQLite and written incrementally.
+
+The scraper adds every meeting as it is downloaded and extraction records
+the document type, meeting number, date and status as each PDF is
+processed, so the catalog is always up to date and can be queried without
+scanning files:
+
+    python catalog.py query --type transcript --from 2024-01-01 --to 2024-03-31
+    python catalog.py export-csv meetings.csv
+
+`export_csv` writes the pipe-separated `meetings.csv` of earlier versions.
+"""
+from pathlib import Path
+import argparse
+import csv
+import re
+import sqlite3
+from dates import get_time_str
+from io_utils import BUSY_TIMEOUT
+from manifest import MEETING_COLUMNS, Manifest
+
+CATALOG_FILE = "catalog.sqlite"
+
+DOWNLOADED = "downloaded"
+EXTRACTED = "extracted"
+EXTRACT_FAILED = "extract_failed"
+
+RE_MEETING_NUMBER = re.compile(r"S/PV\.(\d+)")
+COLUMNS = [
+    "name_sanitized",
+    "name",
+    "date",
+    "listed_date",
+    "meeting_number",
+    "pdf_type",
+    "status",
+    "pdf_link",
+    "description",
+    "path",
+    "error",
+]
+
+
+def _meeting_number(name: str) -> int | None:
+    match = RE_MEETING_NUMBER.search(name)
+    return int(match.group(1)) if match else None
+
+
+class Catalog:
+    def __init__(self, path: str | Path = CATALOG_FILE):
+        self.path = Path(path)
+        self.db = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS meetings (
+                name_sanitized TEXT PRIMARY KEY,
+                name TEXT,
+                date TEXT,
+                listed_date TEXT,
+                meeting_number INTEGER,
+                pdf_type TEXT,
+                status TEXT NOT NULL,
+                pdf_link TEXT,
+                description TEXT,
+                path TEXT,
+                error TEXT
+            )
+            """
+        )
+        for column in ["name", "date", "meeting_number", "pdf_type", "status"]:
+            self.db.execute(
+                f"CREATE INDEX IF NOT EXISTS meetings_{column} ON meetings ({column})"
+            )
+        self.db.commit()
+
+    def record_download(self, meeting_dict: dict[str, str], path: str | Path) -> None:
+        """Add a downloaded meeting, or mark a known one as downloaded again."""
+        with self.db:
+            self.db.execute(
+                """
+                INSERT INTO meetings (
+                    name_sanitized, name, date, listed_date, meeting_number,
+                    status, pdf_link, description, path
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (name_sanitized) DO UPDATE SET
+                    name = excluded.name,
+                    date = COALESCE(date, excluded.date),
+                    listed_date = excluded.listed_date,
+                    meeting_number = COALESCE(meeting_number, excluded.meeting_number),
+                    status = excluded.status,
+                    pdf_link = excluded.pdf_link,
+                    description = excluded.description,
+                    path = excluded.path
+                """,
+                (
+                    meeting_dict["name_sanitized"],
+                    meeting_dict["name"],
+                    get_time_str(meeting_dict.get("date") or ""),
+                    meeting_dict.get("date"),
+                    _meeting_number(meeting_dict["name"]),
+                    DOWNLOADED,
+                    meeting_dict.get("pdf_link"),
+                    meeting_dict.get("description"),
+                    str(path),
+                ),
+            )
+
+    def record_extraction(
+        self, filename: str, report_dict: dict | None, error: str | None = None
+    ) -> None:
+        """Record the result of extracting `filename` (a PDF named after a meeting)."""
+        name_sanitized = Path(filename).stem
+        report_dict = report_dict or {}
+        meeting_number = report_dict.get("meeting_number")
+
+        with self.db:
+            self.db.execute(
+                """
+                INSERT INTO meetings (
+                    name_sanitized, date, meeting_number, pdf_type, status, error
+                ) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (name_sanitized) DO UPDATE SET
+                    date = COALESCE(excluded.date, date),
+                    meeting_number = COALESCE(excluded.meeting_number, meeting_number),
+                    pdf_type = excluded.pdf_type,
+                    status = excluded.status,
+                    error = excluded.error
+                """,
+                (
+                    name_sanitized,
+                    report_dict.get("date"),
+                    int(meeting_number) if meeting_number else None,
+                    report_dict.get("type"),
+                    EXTRACT_FAILED if error else EXTRACTED,
+                    error,
+                ),
+            )
+
+    def import_manifest(self, manifest: Manifest) -> int:
+        """Add meetings downloaded before the catalog existed."""
+        known = {row[0] for row in self.db.execute("SELECT name FROM meetings")}
+        missing = [m for m in manifest.meetings.values() if m["name"] not in known]
+        for meeting_dict in missing:
+            self.record_download(meeting_dict, meeting_dict["path"])
+        return len(missing)
+
+    def query(
+        self,
+        name: str | None = None,
+        date_from: str | None = None,
+        date_to: str | None = None,
+        meeting_number: int | None = None,
+        pdf_type: str | None = None,
+        status: str | None = None,
+        limit: int | None = None,
+    ) -> list[dict]:
+        """Meetings matching all given filters, ordered by date.
+
+        `name` may contain SQL LIKE wildcards ("S/PV.95%") and also matches
+        the sanitized name (meetings only known from extraction). Dates are ISO
+        strings; `date_to` includes the whole day.
+        """
+        conditions, params = [], []
+        if name is not None:
+            conditions.append("(name LIKE ? OR name_sanitized LIKE ?)")
+            params += [name, name]
+        if date_from is not None:
+            conditions.append("date >= ?")
+            params.append(date_from)
+        if date_to is not None:
+            conditions.append("date < date(?, '+1 day')")
+            params.append(date_to)
+        if meeting_number is not None:
+            conditions.append("meeting_number = ?")
+            params.append(meeting_number)
+        if pdf_type is not None:
+            conditions.append("pdf_type = ?")
+            params.append(pdf_type)
+        if status is not None:
+            conditions.append("status = ?")
+            params.append(status)
+
+        query = "SELECT * FROM meetings"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY date, name_sanitized"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        return [dict(row) for row in self.db.execute(query, params)]
+
+    def counts(self) -> dict[str, int]:
+        return dict(
+            self.db.execute("SELECT status, COUNT(*) FROM meetings GROUP BY status")
+        )
+
+    def export_csv(self, csv_path: str | Path) -> int:
+        """Write downloaded meetings as the pipe-separated meetings.csv."""
+        rows = self.db.execute(
+            "SELECT name, name_sanitized, listed_date AS date, pdf_link, description "
+            "FROM meetings WHERE name IS NOT NULL ORDER BY rowid"
+        ).fetchall()
+
+        with open(csv_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f, delimiter="|", lineterminator="\n")
+            writer.writerow(MEETING_COLUMNS)
+            writer.writerows(rows)
+
+        return len(rows)
+
+    def close(self) -> None:
+        self.db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the meeting catalog")
+    parser.add_argument("--catalog", default=CATALOG_FILE, help="Catalog file")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    query_parser = commands.add_parser("query", help="List matching meetings")
+    query_parser.add_argument("--name", help="Name pattern, e.g. S/PV.95%%")
+    query_parser.add_argument("--from", dest="date_from", help="First date (ISO)")
+    query_parser.add_argument("--to", dest="date_to", help="Last date (ISO)")
+    query_parser.add_argument("--number", type=int, help="Meeting number")
+    query_parser.add_argument("--type", help="PDF type, e.g. transcript")
+    query_parser.add_argument("--status", help="e.g. extracted or extract_failed")
+    query_parser.add_argument("--limit", type=int)
+
+    export_parser = commands.add_parser("export-csv", help="Write meetings.csv")
+    export_parser.add_argument("output", nargs="?", default="meetings.csv")
+
+    commands.add_parser("status", help="Count meetings per status")
+    args = parser.parse_args()
+
+    catalog = Catalog(args.catalog)
+    if args.command == "query":
+        for row in catalog.query(
+            args.name,
+            args.date_from,
+            args.date_to,
+            args.number,
+            args.type,
+            args.status,
+            args.limit,
+        ):
+            print("|".join("" if row[c] is None else str(row[c]) for c in COLUMNS[:7]))
+    elif args.command == "export-csv":
+        print(f"Exported {catalog.export_csv(args.output)} meetings to {args.output}")
+    else:
+        for status, count in catalog.counts().items():
+            print(f"{status:<16} {count}")
+    catalog.close()
@@ -0,0 +1,59 @@
+"""
+Meeting dates as written in the records, e.g. "19 March 2024, 3.10 p.m.".
+
+Kept free of heavy imports, as the catalog (and through it the scraper)
+needs it without loading the extraction code.
+"""
+from datetime import datetime
+import re
+
+
+def get_time_str(text: str) -> str | None:
+    """Return the meeting time in `text` (e.g. "19 March 2024, 3.10 p.m.")."""
+    months = [
+        "January",
+        "February",
+        "March",
+        "April",
+        "May",
+        "June",
+        "July",
+        "August",
+        "September",
+        "October",
+        "November",
+        "December",
+    ]
+
+    re_day = r"(?P<day>\d{1,2})"
+    re_month = f"(?P<month>{'|'.join(months)})"
+    re_year = r"(?P<year>\d{4})"
+    re_hour = r"(?P<hour>\d{1,2})"
+    re_minute = r"(?P<minute>\d{1,2})"
+    re_daytime = r"(?P<daytime>a|p)"
+
+    time_regex = re.compile(
+        f"{re_day} {re_month} {re_year}(, {re_hour}(\\.{re_minute})? {re_daytime})?"
+    )
+
+    match = re.search(time_regex, text)
+    if match is None:
+        return None
+
+    day = int(match.group("day"))
+    month_str = match.group("month")
+    month = months.index(month_str) + 1
+    year = int(match.group("year"))
+
+    if match.group("hour"):
+        hour = int(match.group("hour"))
+        minute = int(match.group("minute") or 0)
+        if match.group("daytime") == "p" and hour < 12:
+            hour += 12
+    else:
+        hour = 0
+        minute = 0
+
+    time = datetime(year, month, day, hour, minute)
+
+    return str(time)
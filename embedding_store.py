@@ -0,0 +1,147 @@
+"""
+On-disk store for embeddings, so identical speeches are embedded only once.
+
+Vectors live in flat files of fixed-size rows, one with float32 vectors
+and one with their ubinary quantization per (model, dimensions), which are
+read through read-only memory maps. A SQLite index maps (model, dimensions,
+use case, text hash) to a row number in the files of its model.
+
+Appends first write and fsync the vectors, then commit the index rows. After
+a crash, rows without a committed index entry are cut off on the next open,
+so the store never points at partially written vectors. Only one process
+should append to a store at a time.
+"""
+from pathlib import Path
+import os
+import sqlite3
+import numpy as np
+from io_utils import hash_bytes
+
+EMBEDDING_FOLDER = "embeddings"
+INDEX_FILE = "index.sqlite"
+FLOAT_FILE = "{model}-{dimensions}.float32.bin"
+BINARY_FILE = "{model}-{dimensions}.ubinary.bin"
+QUERY_CHUNK = 500  # Keeps "IN (...)" queries below SQLite's variable limit
+
+
+def hash_text(text: str) -> str:
+    return hash_bytes(text.encode("utf-8"))
+
+
+class EmbeddingStore:
+    def __init__(self, folder: str | Path, model_name: str, dimensions: int) -> None:
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.model_name = model_name
+        self.dimensions = dimensions
+
+        self.db = sqlite3.connect(self.folder / INDEX_FILE)
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                dimensions INTEGER NOT NULL,
+                use_case TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                row INTEGER NOT NULL,
+                PRIMARY KEY (model, dimensions, use_case, text_hash)
+            )
+            """
+        )
+        self.db.commit()
+
+        self.rows = self.db.execute(
+            "SELECT COALESCE(MAX(row) + 1, 0) FROM embeddings "
+            "WHERE model = ? AND dimensions = ?",
+            (model_name, dimensions),
+        ).fetchone()[0]
+        # Each (model, dimensions) has its own files, so rows always have
+        # the width this store was opened with
+        names = {"model": model_name.replace("/", "--"), "dimensions": dimensions}
+        float_path = self.folder / FLOAT_FILE.format(**names)
+        binary_path = self.folder / BINARY_FILE.format(**names)
+        self._files = {
+            "float": (float_path, np.float32, dimensions),
+            "binary": (binary_path, np.uint8, dimensions // 8),
+        }
+        self._memmaps = {}
+        self._discard_uncommitted_rows()
+
+    def _discard_uncommitted_rows(self) -> None:
+        for path, dtype, width in self._files.values():
+            row_bytes = np.dtype(dtype).itemsize * width
+            if path.exists() and path.stat().st_size > self.rows * row_bytes:
+                os.truncate(path, self.rows * row_bytes)
+
+    def _memmap(self, kind: str) -> np.ndarray:
+        memmap = self._memmaps.get(kind)
+        if memmap is not None and len(memmap) == self.rows:
+            return memmap
+
+        path, dtype, width = self._files[kind]
+        if self.rows == 0:
+            return np.empty((0, width), dtype=dtype)
+
+        memmap = np.memmap(path, dtype=dtype, mode="r", shape=(self.rows, width))
+        self._memmaps[kind] = memmap
+        return memmap
+
+    @property
+    def floats(self) -> np.ndarray:
+        """Read-only (rows, dimensions) float32 memory map."""
+        return self._memmap("float")
+
+    @property
+    def binary(self) -> np.ndarray:
+        """Read-only (rows, dimensions / 8) uint8 memory map of ubinary vectors."""
+        return self._memmap("binary")
+
+    def lookup(self, text_hashes: list[str], use_case: str) -> list[int | None]:
+        """Row of every hash in `text_hashes`, or None if it is not stored."""
+        found = {}
+        for start in range(0, len(text_hashes), QUERY_CHUNK):
+            chunk = text_hashes[start : start + QUERY_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            found.update(
+                self.db.execute(
+                    "SELECT text_hash, row FROM embeddings WHERE model = ? "
+                    "AND dimensions = ? AND use_case = ? "
+                    f"AND text_hash IN ({placeholders})",
+                    (self.model_name, self.dimensions, use_case, *chunk),
+                )
+            )
+        return [found.get(text_hash) for text_hash in text_hashes]
+
+    def append(
+        self,
+        text_hashes: list[str],
+        use_case: str,
+        floats: np.ndarray,
+        binary: np.ndarray,
+    ) -> list[int]:
+        """Store new embeddings (hashes must not be stored yet), return their rows."""
+        rows = list(range(self.rows, self.rows + len(text_hashes)))
+
+        for kind, vectors in (("float", floats), ("binary", binary)):
+            path, dtype, width = self._files[kind]
+            data = np.ascontiguousarray(vectors, dtype=dtype).reshape(-1, width)
+            with open(path, "ab") as f:
+                f.write(data.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+        with self.db:
+            self.db.executemany(
+                "INSERT INTO embeddings VALUES (?, ?, ?, ?, ?)",
+                [
+                    (self.model_name, self.dimensions, use_case, text_hash, row)
+                    for text_hash, row in zip(text_hashes, rows)
+                ],
+            )
+
+        self.rows += len(rows)
+        return rows
+
+    def close(self) -> None:
+        self._memmaps.clear()
+        self.db.close()
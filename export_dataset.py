@@ -0,0 +1,188 @@
+"""
+Export extracted reports as a Parquet dataset with one row per speech.
+
+The dataset is partitioned by meeting year (`<folder>/year=2024/...`) and
+written in row groups of at most `row_group_size` rows. Once the rows
+buffered across all years hold more than `buffer_bytes` of text, the largest
+buffer is written out early, so reports are streamed through without
+holding the corpus in memory. Parquet stores each
+column separately, so reading e.g. only speaker and country never touches
+the speech texts:
+
+    read_speeches("dataset", columns=["speaker", "country"])
+"""
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, Iterator
+import argparse
+import pyarrow as pa
+import pyarrow.parquet as pq
+from io_utils import get_files_from_folder
+from jsonl_shards import SHARD_PATTERN, iter_shard_records
+from speakers import get_speaker_country
+from transcript import Transcript
+
+DATASET_FOLDER = "dataset"
+ROW_GROUP_SIZE = 50_000
+BUFFER_BYTES = 64 * 1024**2  # Text buffered across all year partitions
+UNKNOWN_YEAR = "unknown"
+
+SCHEMA = pa.schema(
+    [
+        ("meeting_number", pa.string()),
+        ("date", pa.timestamp("s")),
+        ("type", pa.string()),
+        ("speech_index", pa.int32()),
+        ("speaker", pa.string()),
+        ("country", pa.string()),
+        ("text", pa.string()),
+    ]
+)
+
+
+def iter_speech_rows(transcript: Transcript) -> Iterator[dict]:
+    """Yield one row per speech of an extracted transcript."""
+    metadata = transcript.metadata
+    members = metadata.get("members", {})
+    date = metadata.get("date")
+
+    for index, (speaker, text) in enumerate(transcript.speeches()):
+        yield {
+            "meeting_number": metadata.get("meeting_number"),
+            "date": datetime.fromisoformat(date) if date else None,
+            "type": metadata.get("type"),
+            "speech_index": index,
+            "speaker": speaker,
+            "country": get_speaker_country(speaker, members),
+            "text": text,
+        }
+
+
+def iter_transcripts(extracted_folder: str) -> Iterator[Transcript]:
+    """Read reports from JSONL shards if the folder has any, else JSON files."""
+    if any(Path(extracted_folder).glob(SHARD_PATTERN)):
+        for record in iter_shard_records(extracted_folder):
+            yield Transcript(record)
+        return
+
+    for filename in sorted(get_files_from_folder(extracted_folder)):
+        if filename.endswith(".json"):
+            yield Transcript.from_file(Path(extracted_folder) / filename)
+
+
+def _row_size(row: dict) -> int:
+    """Approximate size of a row, by the length of its strings."""
+    return sum(len(value) for value in row.values() if isinstance(value, str))
+
+
+class DatasetWriter:
+    """Streams speech rows into one Parquet file per year partition."""
+
+    def __init__(
+        self,
+        folder: str | Path,
+        row_group_size: int = ROW_GROUP_SIZE,
+        buffer_bytes: int = BUFFER_BYTES,
+    ):
+        self.folder = Path(folder)
+        self.row_group_size = row_group_size
+        self.buffer_bytes = buffer_bytes
+        self.rows_written = 0
+        self._writers: dict[str, pq.ParquetWriter] = {}
+        self._buffers: dict[str, list[dict]] = defaultdict(list)
+        self._buffer_sizes: dict[str, int] = defaultdict(int)
+        self._buffered_bytes = 0
+
+    def __enter__(self) -> "DatasetWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def write(self, transcript: Transcript) -> None:
+        for row in iter_speech_rows(transcript):
+            year = str(row["date"].year) if row["date"] else UNKNOWN_YEAR
+            buffer = self._buffers[year]
+            buffer.append(row)
+            size = _row_size(row)
+            self._buffer_sizes[year] += size
+            self._buffered_bytes += size
+
+            if len(buffer) >= self.row_group_size:
+                self._flush(year)
+            elif self._buffered_bytes > self.buffer_bytes:
+                self._flush(max(self._buffer_sizes, key=self._buffer_sizes.get))
+
+    def _flush(self, year: str) -> None:
+        rows = self._buffers.pop(year, [])
+        self._buffered_bytes -= self._buffer_sizes.pop(year, 0)
+        if not rows:
+            return
+
+        writer = self._writers.get(year)
+        if writer is None:
+            partition = self.folder / f"year={year}"
+            partition.mkdir(parents=True, exist_ok=True)
+            writer = pq.ParquetWriter(partition / "part-0.parquet", SCHEMA)
+            self._writers[year] = writer
+
+        table = pa.Table.from_pylist(rows, schema=SCHEMA)
+        writer.write_table(table, row_group_size=self.row_group_size)
+        self.rows_written += len(rows)
+
+    def close(self) -> None:
+        for year in list(self._buffers):
+            self._flush(year)
+        for writer in self._writers.values():
+            writer.close()
+        self._writers.clear()
+
+
+def export_dataset(
+    transcripts: Iterable[Transcript],
+    folder: str | Path = DATASET_FOLDER,
+    row_group_size: int = ROW_GROUP_SIZE,
+    buffer_bytes: int = BUFFER_BYTES,
+) -> int:
+    """Write all speeches of `transcripts` to `folder`, returning the row count."""
+    with DatasetWriter(folder, row_group_size, buffer_bytes) as writer:
+        for transcript in transcripts:
+            if transcript.metadata.get("type") in ["transcript", "resumption"]:
+                writer.write(transcript)
+
+    return writer.rows_written
+
+
+def read_speeches(
+    folder: str | Path = DATASET_FOLDER, columns: list[str] | None = None, **kwargs
+) -> pa.Table:
+    """Read the dataset, loading only `columns` (all columns if None)."""
+    return pq.read_table(folder, columns=columns, partitioning="hive", **kwargs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export speeches to Parquet")
+    parser.add_argument("--input", default="extracted", help="Extracted reports")
+    parser.add_argument("--output", default=DATASET_FOLDER, help="Dataset folder")
+    parser.add_argument(
+        "--row-group-size",
+        type=int,
+        default=ROW_GROUP_SIZE,
+        help="Maximum number of rows per Parquet row group",
+    )
+    parser.add_argument(
+        "--buffer-bytes",
+        type=int,
+        default=BUFFER_BYTES,
+        help="Text buffered across all years before the largest year is written",
+    )
+    args = parser.parse_args()
+
+    rows = export_dataset(
+        iter_transcripts(args.input),
+        args.output,
+        args.row_group_size,
+        args.buffer_bytes,
+    )
+    print(f"Exported {rows} speeches to {args.output}")
@@ -1,67 +1,90 @@
-from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from functools import cache, partial
+import argparse
 import json
+import os
 from pathlib import Path
 import re
+import shutil
+import traceback
+from typing import TYPE_CHECKING, Iterator, TextIO
+import tempfile
 import fitz
-from multi_column import get_pages
-from io_utils import get_files_from_folder
+from cache import CACHE_FOLDER, DiskCache
+from dates import get_time_str
+from multi_column import get_page_text, iter_pages, layout_signature
+from io_utils import get_files_from_folder, hash_file
+from jsonl_shards import SHARD_SIZE, JsonlShardWriter
+from memory import MemoryCeiling, MemoryLimitExceeded
+from metrics import metrics
+from pdf_store import STORE_FOLDER, PdfStore
+
+if TYPE_CHECKING:
+    from catalog import Catalog
+    from search_index import SearchIndex
 
 country_uk_gb_ni = "United Kingdom of Great Britain\nand Northern Ireland"
+ERROR_REPORT = "extraction_errors.json"
+METRICS_PREFIX = "extract_metrics"
+EXTRACTOR_VERSION = 2  # Bump whenever a change alters process_doc's output
+LAYOUT_CACHE_BYTES = 2 * 1024**3
+RESULT_CACHE_BYTES = 1024**3
 
 def _str_contains_binary(text: str) -> bool:
     return bool(re.search(r"(\\x\d{2}){2,}", text))
 
-def get_time_str(text: str) -> str:
-    # ! NOT USED YET, NEEDS TO BE CALLED IN GET_METADATA
-    re_day = r"(?P<day>\d{1,2})"
-    re_month = r"(?P<month>(\w+))"
-    re_year = r"(?P<year>\d{4})"
-    re_hour = r"(?P<hour>\d{1,2})"
-    re_minute = r"(?P<minute>\d{1,2})"
-    re_daytime = r"(?P<daytime>a|p)"
-
-    time_regex = re.compile(
-        f"{re_day} {re_month} {re_year}(, {re_hour}\.?{re_minute} {re_daytime})?"
-    )
 
-    match = re.search(time_regex, text)
-
-    months = [
-        "January",
-        "February",
-        "March",
-        "April",
-        "May",
-        "June",
-        "July",
-        "August",
-        "September",
-        "October",
-        "November",
-        "December",
-    ]
+RE_WHITESPACE = re.compile(r"\s+")
 
-    day = int(match.group("day"))
-    month_str = match.group("month")
-    month = months.index(month_str) + 1
-    year = int(match.group("year"))
+# Speaker labels such as "Mr. Hoxha (Albania) (spoke in French):"
+_re_speaker_title = r"(?P<Title>((Mr|Mr|Ms|Mrs).|Dame|Miss|Sir))"
+_re_speaker_person = r"(?P<Person>([A-Za-zÀ-ȕ-]+)( [A-Za-zÀ-ȕ-]+)*)"
+_re_speaker_country = r"(?P<Country>\([A-Za-zÀ-ȕ\ ]+\))"  # surrounded by brackets
+_re_speaker_language = r"(?P<Language>\(spoke in [A-Za-zÀ-ȕ\ ]+\))"
+RE_SPEAKER = re.compile(
+    f"\n?(({_re_speaker_title} ?{_re_speaker_person} ?{_re_speaker_country}?"
+    f"|The President) ?{_re_speaker_language}?):"
+)
 
-    if match.group("hour"):
-        hour = int(match.group("hour"))
-        minute = int(match.group("minute"))
-        if match.group("daytime") == "p":
-            hour += 12
-    else:
-        hour = 0
-        minute = 0
 
-    time = datetime(year, month, day, hour, minute)
+def replace_newlines(text: str) -> str:
+    return RE_WHITESPACE.sub(" ", text)
 
-    return str(time)
 
+class NormalizedText:
+    """Builds replace_newlines(text) from consecutive pieces of text.
 
-def replace_newlines(text: str) -> str:
-    return re.sub("\s+", " ", text)
+    Whitespace runs spanning two pieces still collapse into a single space.
+    With keep=False only the length is tracked, which is enough for offsets.
+    With a `sink` (a text file) the normalised text is written there instead
+    of kept in memory.
+    """
+
+    def __init__(self, keep: bool = True, sink: TextIO | None = None):
+        self.keep = keep
+        self.sink = sink
+        self.length = 0
+        self._parts = []
+        self._ends_with_space = False
+
+    def write(self, raw: str) -> str:
+        """Append `raw` and return its normalised form as it was appended."""
+        text = RE_WHITESPACE.sub(" ", raw)
+        if self._ends_with_space and text.startswith(" "):
+            text = text[1:]
+
+        if text:
+            if self.sink is not None:
+                self.sink.write(text)
+            elif self.keep:
+                self._parts.append(text)
+            self.length += len(text)
+            self._ends_with_space = text.endswith(" ")
+
+        return text
+
+    def getvalue(self) -> str:
+        return "".join(self._parts)
 
 
 def _is_communique_of_closed_meeting(page_zero) -> bool:
@@ -116,6 +139,7 @@ def extract_metadata(first_page: dict[int, str]) -> dict[str, str]:
     header_text = text[substring_indices["header"][0]: substring_indices["header"][1]]
     meeting_number_match = re.search(regex_meeting_number, header_text)
     meeting_number = meeting_number_match.group("Meeting_Nr")
+    date = get_time_str(header_text)
 
     # President:
     president_text = text[substring_indices["president"][0]: substring_indices["president"][1]]
@@ -143,6 +167,7 @@ def extract_metadata(first_page: dict[int, str]) -> dict[str, str]:
 
     metadata = {
         "agenda": agenda,
+        "date": date,
         "meeting_number": meeting_number,
         "members": speaker_to_country,
         "president": (president, president_country),
@@ -211,58 +236,104 @@ def extract_metadata_old(first_page: dict[int, str]) -> dict[str, str]:
     return metadata
 
 
-def get_text_indices_with_speakers(matches, text) -> list[tuple[str, str, str]]:
-    matches = list(matches)
-
-    if not matches:
-        return []
-
-    text_indices_with_speakers = []
-    text_indices_with_speakers.append((0, matches[0].start(), "Intro"))
-
-    for match_index, match in enumerate(matches):
-        # + 1 to offset space after. Could bake into regex
-        text_start = match.end() + 1
-
-        if match_index + 1 < len(matches):
-            text_end = matches[match_index + 1].start()
-        else:
-            text_end = len(text)
-
-        # Can be done more nicely
-        name = match[0].replace("\n", "")
-        name = name.replace(":", "")
-
-        text_indices_with_speakers.append((text_start, text_end, name))
-
-    return text_indices_with_speakers
+class SpeakerSplitter:
+    """Split text arriving in pieces, e.g. page by page, into speeches.
+
+    `feed` yields the (speaker, start, end, speech) of the speeches a piece
+    completes and `close` the last one, see iter_speaker_spans. Only text
+    not yet written to `normalized` (in practice the current speech) is kept.
+
+    A speaker label ends at a ":" and contains no other, so every label
+    starting before the last ":" fed so far is already complete; the text
+    after it is searched again once more has arrived.
+    """
+
+    def __init__(self, normalized: NormalizedText):
+        self.normalized = normalized
+        self.text = ""  # Text fed but not yet written, from offset `base` on
+        self.base = 0
+        self.position = 0  # Everything before this offset has been written
+        self.searched = 0  # Labels have been searched for up to here
+        self.speaker = None
+        self.start = 0
+
+    def _write_speech(self, speaker: str, start: int, end: int):
+        text, base = self.text, self.base
+        if start > self.position:
+            self.normalized.write(text[self.position - base : start - base])
+            self.position = min(start, base + len(text))
+
+        body = text[self.position - base : end - base]
+        core = body.strip()
+        leading = len(body) - len(body.lstrip())
+
+        self.normalized.write(body[:leading])
+        speech_start = self.normalized.length
+        speech = self.normalized.write(core)
+        speech_end = self.normalized.length
+        self.normalized.write(body[leading + len(core) :])
+
+        self.position = max(self.position, end)
+        return speaker, speech_start, speech_end, speech
+
+    def feed(self, piece: str) -> Iterator[tuple[str, int, int, str]]:
+        self.text += piece
+        complete = self.text.rfind(":") + 1  # Labels can end up to here
+        if self.base + complete <= self.searched:
+            return
+
+        for match in RE_SPEAKER.finditer(
+            self.text, self.searched - self.base, complete
+        ):
+            yield self._write_speech(
+                self.speaker or "Intro", self.start, self.base + match.start()
+            )
+            self.speaker = match[0].replace("\n", "").replace(":", "")
+            self.start = self.base + match.end() + 1
+        self.searched = self.base + complete
+
+        # Drop what has been written and searched
+        keep_from = min(self.position, self.searched)
+        self.text = self.text[keep_from - self.base :]
+        self.base = keep_from
+
+    def close(self) -> Iterator[tuple[str, int, int, str]]:
+        if self.speaker is not None:
+            yield self._write_speech(
+                self.speaker, self.start, self.base + len(self.text)
+            )
+        self.normalized.write(self.text[self.position - self.base :])
+        self.text = ""
+
+
+def iter_speaker_spans(
+    text: str, normalized: NormalizedText | None = None
+) -> Iterator[tuple[str, int, int, str]]:
+    """Split `text` into speeches in a single scan.
+
+    Yields (speaker, start, end, speech) per speech, starting with the
+    "Intro" before the first speaker. While scanning, the whole of `text` is
+    written to `normalized`, and start/end are offsets of the speech in that
+    normalised text. The speech equals the old per-part
+    replace_newlines(part.strip()). Nothing is yielded if no speaker is found.
+    """
+    if normalized is None:
+        normalized = NormalizedText(keep=False)
+
+    splitter = SpeakerSplitter(normalized)
+    yield from splitter.feed(text)
+    yield from splitter.close()
 
 
 def split_text_by_speakers(text: str) -> list[dict[str, str]]:
-    title = r"(?P<Title>((Mr|Mr|Ms|Mrs).|Dame|Miss|Sir))"
-    person = r"(?P<Person>([A-Za-zÀ-ȕ-]+)( [A-Za-zÀ-ȕ-]+)*)"
-    country = r"(?P<Country>\([A-Za-zÀ-ȕ\ ]+\))" # surrounded by brackets
-    language = r"(?P<Language>\(spoke in [A-Za-zÀ-ȕ\ ]+\))"
-
-    speaker_regex = f"\n?(({title} ?{person} ?{country}?|The President) ?{language}?):"
-    matches = re.finditer(speaker_regex, text)
-
-    text_indices_with_speakers = get_text_indices_with_speakers(matches, text)
-    parts = []
-
-    for start, end, speaker in text_indices_with_speakers:
-        part = text[start:end]
-        part = part.strip()
-
-        parts.append({"speaker": speaker, "text": replace_newlines(part)})
-
-        # print(part)
-        # print("\n-------------\n")
-
-    return parts
+    return [
+        {"speaker": speaker, "text": speech}
+        for speaker, _, _, speech in iter_speaker_spans(text)
+    ]
 
 
-def get_pdf_type(title: str, first_page: list[str]) -> str:
+def get_name_pdf_type(title: str) -> str | None:
+    """PDF type implied by the file name alone, if any."""
     if re.search("Corr", title):
         return "correction"
 
@@ -275,60 +346,531 @@ def get_pdf_type(title: str, first_page: list[str]) -> str:
     if re.search("Agenda", title):
         return "agenda"
 
+    return None
+
+
+def get_pdf_type(title: str, first_page: list[str]) -> str:
+    if pdf_type := get_name_pdf_type(title):
+        return pdf_type
+
     if _is_communique_of_closed_meeting(first_page):
         return "communique"
 
     return "transcript"
 
 
-def process_doc(doc) -> dict:
-    pages = get_pages(doc)
+def content_key(path: str, content_hash: str) -> str:
+    """Key of everything `process_doc` reads from the PDF at `path`.
+
+    Besides the content only the type implied by the file name matters, so
+    PDFs sharing a key give the same report.
+    """
+    return f"{content_hash}-{get_name_pdf_type(path) or 'content'}"
 
-    pdf_type = get_pdf_type(doc.name, pages[0])
 
-    if not pages[0]:
+def _get_checked_pdf_type(doc, first_page: list[str]) -> str | None:
+    """Type of `doc`, or None if its first page has no usable text."""
+    pdf_type = get_pdf_type(doc.name, first_page)
+
+    if not first_page:
         print(f"Failed to extract {doc.name}")
-        return {}
-    
-    if pages[0][0] and _str_contains_binary(pages[0][0]):
+        return None
+
+    if first_page[0] and _str_contains_binary(first_page[0]):
         print(f"{doc.name} contains binary str")
+        return None
+
+    return pdf_type
+
+
+def process_doc(
+    doc, pages: list[list[str]] | None = None, compact: bool = False
+) -> dict:
+    """Extract type, metadata and speeches of `doc`.
+
+    Pages are laid out lazily: the type is decided from the file name and the
+    first page, and the remaining pages are only laid out for transcripts and
+    resumptions. `pages` may hold the layout of the first pages already (e.g.
+    from a cache); pages laid out here are appended to it.
+
+    With compact=True the speeches in "by_speaker" are not copied; they carry
+    "start"/"end" offsets into "text" instead (see transcript.py).
+    """
+    if pages is None:
+        pages = []
+
+    if not pages:
+        pages.append(get_page_text(doc[0]))
+
+    pdf_type = _get_checked_pdf_type(doc, pages[0])
+    if pdf_type is None:
         return {}
 
     if pdf_type in ["transcript", "resumption"]:
         # TODO: Make metadata extraction dependent on PDF type
-        metadata = extract_metadata(pages[0])
+        with metrics.timer("metadata"):
+            metadata = extract_metadata(pages[0])
+        pages.extend(iter_pages(doc, start=len(pages)))
 
         # TODO: Extract text cleaning (newlines, etc.) into own function and apply to text_full as well...
         text_full = "".join(["".join(page) for page in pages[1:]])
-        parts = split_text_by_speakers(text_full)
+        normalized = NormalizedText()
+        with metrics.timer("speaker_split"):
+            if compact:
+                parts = [
+                    {"speaker": speaker, "start": start, "end": end}
+                    for speaker, start, end, _ in iter_speaker_spans(
+                        text_full, normalized
+                    )
+                ]
+            else:
+                parts = [
+                    {"speaker": speaker, "text": speech}
+                    for speaker, _, _, speech in iter_speaker_spans(
+                        text_full, normalized
+                    )
+                ]
+        metrics.count("speeches", len(parts))
 
         report_dict = {
             "type": pdf_type,
             **metadata,
             "by_speaker": parts,
-            "text": replace_newlines(text_full),
+            "text": normalized.getvalue(),
         }
+        if compact:
+            report_dict["format"] = "compact"
     else:
         report_dict = {"type": pdf_type}
 
     return report_dict
 
 
-if __name__ == "__main__":
-    files = get_files_from_folder("source")
-    # files = ["S_PV.9533.pdf"]
-    extracted_folder = Path("extracted")
+def process_doc_streaming(
+    doc,
+    output_path: Path,
+    compact: bool = False,
+    ceiling: MemoryCeiling | None = None,
+) -> dict:
+    """Write the report of `process_doc` to `output_path`, a page at a time.
+
+    Returns the report without "by_speaker" and "text".
+    """
+    ceiling = ceiling or MemoryCeiling()
+    first_page = get_page_text(doc[0])
+    pdf_type = _get_checked_pdf_type(doc, first_page)
+    if pdf_type not in ["transcript", "resumption"]:
+        report_dict = {"type": pdf_type} if pdf_type else {}
+        write_report(report_dict, output_path, compact)
+        return report_dict
+
+    with metrics.timer("metadata"):
+        report_dict = {"type": pdf_type, **extract_metadata(first_page)}
+    ceiling.check("page 1")
+
+    partial_path = output_path.with_name(output_path.name + ".partial")
+    try:
+        with (
+            open(partial_path, "w", encoding="utf-8") as f,
+            tempfile.TemporaryFile("w+", encoding="utf-8") as spool,
+        ):
+            writer = _ReportWriter(f, report_dict, compact)
+            splitter = SpeakerSplitter(NormalizedText(sink=spool))
+
+            for page_number, page in enumerate(iter_pages(doc, start=1), 2):
+                with metrics.timer("speaker_split"):
+                    for text in page:
+                        writer.write_speeches(splitter.feed(text))
+                ceiling.check(f"page {page_number}")
+            with metrics.timer("speaker_split"):
+                writer.write_speeches(splitter.close())
+
+            spool.seek(0)
+            writer.close(spool)
+        os.replace(partial_path, output_path)
+    finally:
+        partial_path.unlink(missing_ok=True)
+
+    metrics.count("speeches", writer.speeches)
+    return report_dict
+
+
+class _ReportWriter:
+    """Writes a report to `f` piece by piece, formatted like `write_report`."""
+
+    def __init__(self, f: TextIO, head: dict, compact: bool):
+        self.f = f
+        self.compact = compact
+        self.speeches = 0
+
+        if compact:
+            f.write(self._dumps(head)[:-1] + ',"by_speaker":[')
+        else:
+            f.write(self._dumps(head)[:-2] + ',\n    "by_speaker": [')
+
+    def _dumps(self, value) -> str:
+        if self.compact:
+            return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+        return json.dumps(value, indent=4, ensure_ascii=False)
+
+    def write_speeches(self, spans: Iterator[tuple[str, int, int, str]]) -> None:
+        for speaker, start, end, speech in spans:
+            if self.compact:
+                part = {"speaker": speaker, "start": start, "end": end}
+                separator = "," if self.speeches else ""
+                self.f.write(separator + self._dumps(part))
+            else:
+                part = {"speaker": speaker, "text": speech}
+                separator = ",\n" if self.speeches else "\n"
+                dump = self._dumps(part).replace("\n", "\n        ")
+                self.f.write(f"{separator}        {dump}")
+            self.speeches += 1
+
+    def close(self, text: TextIO, chunk_size: int = 1 << 20) -> None:
+        """Finish the report with the normalised text read from `text`."""
+        if self.compact:
+            self.f.write('],"text":"')
+        else:
+            self.f.write("\n    ]" if self.speeches else "]")
+            self.f.write(',\n    "text": "')
+
+        while chunk := text.read(chunk_size):
+            self.f.write(json.dumps(chunk, ensure_ascii=False)[1:-1])
+
+        self.f.write('","format":"compact"}' if self.compact else '"\n}')
+
+
+def open_pdf(path: str) -> fitz.Document:
+    with metrics.timer("fitz_open"):
+        return fitz.open(path)
+
+
+def extract_file(
+    path: str,
+    layout_cache: DiskCache | None = None,
+    result_cache: DiskCache | None = None,
+    compact: bool = False,
+    content_hash: str | None = None,
+) -> dict:
+    """Run `process_doc` on the PDF at `path`, reusing cached pages and reports."""
+    if layout_cache is None and result_cache is None:
+        with open_pdf(path) as doc:
+            return process_doc(doc, compact=compact)
+
+    if content_hash is None:
+        content_hash = hash_file(path)
+    result_key = (
+        f"{content_key(path, content_hash)}-v{EXTRACTOR_VERSION}-{layout_signature()}"
+    )
+    if compact:
+        result_key += "-compact"
+
+    if result_cache is not None:
+        report_dict = result_cache.get(result_key)
+        if report_dict is not None:
+            metrics.count("result_cache_hits")
+            return report_dict
+
+    with open_pdf(path) as doc:
+        pages = []
+        if layout_cache is not None:
+            # process_doc lays out pages with get_page_text's defaults
+            layout_key = f"{content_hash}-{layout_signature()}"
+            pages = layout_cache.get(layout_key) or []
+
+        cached_pages = len(pages)
+        report_dict = process_doc(doc, pages, compact)
+
+        if layout_cache is not None and len(pages) > cached_pages:
+            layout_cache.set(layout_key, pages)
 
+    if result_cache is not None:
+        result_cache.set(result_key, report_dict)
+
+    return report_dict
+
+
+def extract_file_streaming(
+    path: str,
+    output_path: Path,
+    compact: bool = False,
+    memory_limit: int | None = None,
+) -> dict:
+    """Run `process_doc_streaming` on the PDF at `path`, within `memory_limit` bytes."""
+    ceiling = MemoryCeiling(memory_limit)
+    try:
+        with open_pdf(path) as doc:
+            return process_doc_streaming(doc, output_path, compact, ceiling)
+    except MemoryLimitExceeded:
+        metrics.count("documents_over_memory_limit")
+        raise
+    finally:
+        fitz.TOOLS.store_shrink(100)  # The next document starts from the baseline
+        metrics.memory(Path(path).name, ceiling.peak)
+
+
+@cache
+def _get_caches(cache_folder: str) -> tuple[DiskCache, DiskCache]:
+    """Open the caches once per worker process."""
+    layout_cache = DiskCache(Path(cache_folder) / "layout", LAYOUT_CACHE_BYTES)
+    result_cache = DiskCache(Path(cache_folder) / "result", RESULT_CACHE_BYTES)
+    return layout_cache, result_cache
+
+
+def _init_worker() -> None:
+    """Drop the metrics a forked worker inherited from the parent."""
+    metrics.reset()
+
+
+def _extract_file_isolated(
+    filename: str,
+    content_hash: str | None,
+    source_folder: str,
+    cache_folder: str | None = None,
+    compact: bool = False,
+    stream_folder: str | None = None,
+    memory_limit: int | None = None,
+) -> tuple[str, dict | None, str | None, dict]:
+    """Run `extract_file` in a worker, returning the error instead of raising.
+
+    With a `stream_folder`, `extract_file_streaming` writes the report there
+    instead and only the report without speeches and text is returned. The
+    worker's metrics for this file are returned as well, to be merged into
+    the parent's.
+    """
+    report_dict, error = None, None
+    try:
+        with metrics.document(filename):
+            path = f"{source_folder}/{filename}"
+            if stream_folder is not None:
+                output_path = Path(stream_folder) / f"{Path(filename).stem}.json"
+                report_dict = extract_file_streaming(
+                    path, output_path, compact, memory_limit
+                )
+            else:
+                caches = _get_caches(cache_folder) if cache_folder else (None, None)
+                report_dict = extract_file(path, *caches, compact, content_hash)
+    except Exception:
+        error = traceback.format_exc()
+    return filename, report_dict, error, metrics.pop_snapshot()
+
+
+def write_report(report_dict: dict, output_path: Path, compact: bool = False) -> None:
+    with open(output_path, "w", encoding="utf-8") as f:
+        if compact:
+            dump = json.dumps(report_dict, ensure_ascii=False, separators=(",", ":"))
+        else:
+            dump = json.dumps(report_dict, indent=4, ensure_ascii=False)
+        f.write(dump)
+
+
+def extract_folder(
+    source_folder: str = "source",
+    extracted_folder: str = "extracted",
+    workers: int | None = None,
+    chunksize: int = 8,
+    cache_folder: str | None = CACHE_FOLDER,
+    compact: bool = False,
+    jsonl: bool = False,
+    compress: bool = False,
+    shard_size: int = SHARD_SIZE,
+    catalog: "Catalog | None" = None,
+    search_index: "SearchIndex | None" = None,
+    pdf_store: PdfStore | None = None,
+    stream: bool = False,
+    memory_limit: int | None = None,
+) -> dict[str, str]:
+    """Extract every PDF in `source_folder` using a pool of `workers` processes.
+
+    Returns the traceback of every file that failed (filename -> error).
+    """
+    files = sorted(get_files_from_folder(source_folder))
+    extracted_folder = Path(extracted_folder)
+    extracted_folder.mkdir(exist_ok=True)
+    errors = {}
+
+    # PDFs linked into `pdf_store` with the same content key are extracted
+    # once, and the report of the first written for its copies right after it
+    hashes = {}
+    first_files = {}  # content key -> first file with it
+    copies: dict[str, list[str]] = {}  # first file -> later files with its key
     for filename in files:
-        doc = fitz.open(f"source/{filename}")
+        path = f"{source_folder}/{filename}"
+        content_hash = pdf_store.linked_hash(path) if pdf_store else None
+        hashes[filename] = content_hash
+        if content_hash is None:
+            copies[filename] = []
+            continue
+        first = first_files.setdefault(content_key(path, content_hash), filename)
+        copies.setdefault(first, [])
+        if first != filename:
+            copies[first].append(filename)
+    metrics.count("documents_deduplicated", len(files) - len(copies))
+
+    extract = partial(
+        _extract_file_isolated,
+        source_folder=source_folder,
+        cache_folder=cache_folder,
+        compact=compact,
+        stream_folder=str(extracted_folder) if stream else None,
+        memory_limit=memory_limit,
+    )
+    shard_writer = None
+    if jsonl:
+        shard_writer = JsonlShardWriter(extracted_folder, shard_size, compress)
+
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker
+        ) as executor:
+            for filename, report_dict, error, snapshot in executor.map(
+                extract, copies, [hashes[f] for f in copies], chunksize=chunksize
+            ):
+                metrics.merge(snapshot)
+                first_output_path = extracted_folder / f"{Path(filename).stem}.json"
+                for name in [filename, *copies[filename]]:
+                    if catalog is not None:
+                        catalog.record_extraction(name, report_dict, error)
+                    if error is not None:
+                        print(f"Failed to extract {name}")
+                        metrics.count("documents_failed")
+                        errors[name] = error
+                        continue
+
+                    metrics.count("documents_extracted")
+                    stem = Path(name).stem
+                    output_path = None
+                    if shard_writer is not None:
+                        with metrics.timer("serialisation"):
+                            shard_writer.write({"file": stem, **report_dict})
+                    else:
+                        output_path = extracted_folder / f"{stem}.json"
+                        print(output_path)
+                        if not stream:
+                            with metrics.timer("serialisation"):
+                                write_report(report_dict, output_path, compact)
+                        elif name != filename:  # The worker only streamed the first
+                            shutil.copyfile(first_output_path, output_path)
+
+                    if search_index is not None:
+                        with metrics.timer("search_index"):
+                            if stream:
+                                search_index.add_file(stem, output_path)
+                            else:
+                                search_index.add_report(stem, report_dict, output_path)
+    finally:
+        # Also on failure, so the open shard (maybe gzip) is not left truncated
+        if shard_writer is not None:
+            with metrics.timer("serialisation"):
+                shard_writer.close()
+
+    if shard_writer is not None:
+        print(f"Wrote {shard_writer.records_written} reports to {extracted_folder}")
+    if search_index is not None:
+        search_index.commit()
+
+    return errors
 
-        report_dict = process_doc(doc)
-        output_path = extracted_folder / f"{str(Path(filename).stem)}{'.json'}"
-        print(output_path)
 
-        with open(output_path, "w") as f:
-            dump = json.dumps(report_dict, indent=4, ensure_ascii=False).encode("utf-8")
-            f.write(dump.decode())
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract text from meeting PDFs")
+    parser.add_argument("--source", default="source", help="Folder with the PDFs")
+    parser.add_argument("--output", default="extracted", help="Output folder")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of extraction processes",
+    )
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=8,
+        help="Number of files handed to a worker at once",
+    )
+    parser.add_argument(
+        "--cache", default=CACHE_FOLDER, help="Folder for the layout/result caches"
+    )
+    parser.add_argument("--no-cache", action="store_true", help="Disable caching")
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Store speeches as offsets into the text instead of copies",
+    )
+    parser.add_argument(
+        "--jsonl",
+        action="store_true",
+        help="Append reports to JSONL shards instead of one JSON file each",
+    )
+    parser.add_argument(
+        "--gzip", action="store_true", help="Compress the JSONL shards"
+    )
+    parser.add_argument(
+        "--shard-size",
+        type=int,
+        default=SHARD_SIZE,
+        help="Maximum number of reports per JSONL shard",
+    )
+    parser.add_argument(
+        "--catalog", default="catalog.sqlite", help="Meeting catalog to update"
+    )
+    parser.add_argument(
+        "--search-index", help="Also add the speeches to this full-text index"
+    )
+    parser.add_argument(
+        "--pdf-store",
+        default=STORE_FOLDER,
+        help="PDF store whose hashes identify duplicate PDFs, if it exists",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream reports to disk page by page to bound memory (no caching)",
+    )
+    parser.add_argument(
+        "--memory-limit",
+        type=int,
+        help="With --stream, fail documents that push a worker above this RSS (MiB)",
+    )
+    parser.add_argument(
+        "--metrics",
+        default=METRICS_PREFIX,
+        help="Write stage timings to <metrics>.json and <metrics>.prom",
+    )
+    args = parser.parse_args()
+    if args.stream and args.jsonl:
+        parser.error("--stream writes one JSON file per PDF, not JSONL shards")
+
+    from catalog import Catalog
+    from search_index import SearchIndex
+
+    catalog = Catalog(args.catalog)
+    search_index = SearchIndex(args.search_index) if args.search_index else None
+    pdf_store = PdfStore(args.pdf_store) if Path(args.pdf_store).is_dir() else None
+    errors = extract_folder(
+        args.source,
+        args.output,
+        args.workers,
+        args.chunksize,
+        cache_folder=None if args.no_cache else args.cache,
+        compact=args.compact,
+        jsonl=args.jsonl,
+        compress=args.gzip,
+        shard_size=args.shard_size,
+        catalog=catalog,
+        search_index=search_index,
+        pdf_store=pdf_store,
+        stream=args.stream,
+        memory_limit=args.memory_limit * 1024**2 if args.memory_limit else None,
+    )
+    catalog.close()
+    if search_index is not None:
+        search_index.close()
+
+    with open(ERROR_REPORT, "w") as f:
+        json.dump(errors, f, indent=4)
+    print(f"{len(errors)} files failed, see {ERROR_REPORT}")
+    metrics.write(args.metrics)
 
 # TODO: Want some mechanism for combining text correctly.
 # Might want to join with a space and then squash extra spaces with \s+ replacement
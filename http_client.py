@@ -0,0 +1,255 @@
+"""
+Polite HTTP requests for the scraper: per-host rate limits, retries and backoff.
+
+Every host gets its own policy:
+- a token bucket limiting the request rate (HOST_RATES, DEFAULT_RATE),
+- an adaptive concurrency limit: it grows by one slot per window of
+  successful requests and halves on 429/5xx responses (AIMD),
+- a circuit breaker: after BREAKER_FAILURES consecutive failures the host is
+  paused for BREAKER_COOLDOWN seconds, then a single probe request decides
+  whether it is healthy again.
+
+These limits hold per process. Processes crawling together split the rates
+with `HttpClient.share_rate`.
+
+Failed requests (connection errors, timeouts, 429 and 5xx) are retried up
+to MAX_ATTEMPTS times with jittered exponential backoff, waiting at least as
+long as a Retry-After header asks for. Other errors, e.g. an invalid URL,
+are raised straight away and do not count against the host.
+"""
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Callable, Iterator
+from urllib.parse import urlsplit
+import datetime
+import random
+import threading
+import time
+import requests
+from metrics import metrics
+
+DEFAULT_RATE = (4.0, 8)  # Requests per second and burst size
+HOST_RATES = {
+    "www.securitycouncilreport.org": (2.0, 4),
+    "digitallibrary.un.org": (2.0, 4),
+    "daccess-ods.un.org": (2.0, 4),
+}
+MIN_CONCURRENCY = 1
+MAX_CONCURRENCY = 8
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 1.0  # Seconds before the first retry, doubled per attempt
+BACKOFF_CAP = 60.0
+MAX_RETRY_AFTER = 300.0
+BREAKER_FAILURES = 5
+BREAKER_COOLDOWN = 60.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RETRY_ERRORS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Take a token, sleeping until one is available."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+
+            time.sleep(wait)
+
+
+class AdaptiveLimit:
+    """Concurrency limit with additive increase and multiplicative decrease."""
+
+    def __init__(self, initial: int, minimum: int, maximum: int):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self._in_flight = 0
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        with self._condition:
+            self._condition.wait_for(lambda: self._in_flight < int(self.limit))
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._in_flight -= 1
+                self._condition.notify_all()
+
+    def on_success(self) -> None:
+        with self._condition:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+    def on_throttle(self) -> None:
+        with self._condition:
+            self.limit = max(self.minimum, self.limit / 2)
+
+
+class CircuitBreaker:
+    def __init__(self, failures: int, cooldown: float):
+        self.failures = failures
+        self.cooldown = cooldown
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        """Block while the circuit is open; after the cooldown, admit one probe."""
+        while True:
+            with self._lock:
+                if self._opened_at is None:
+                    return
+
+                remaining = self._opened_at + self.cooldown - time.monotonic()
+                if remaining <= 0 and not self._probing:
+                    self._probing = True
+                    return
+
+            time.sleep(max(remaining, 0.1))
+
+    def on_success(self) -> None:
+        with self._lock:
+            self._consecutive_failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def on_abort(self) -> None:
+        """A request ended without telling whether the host is healthy."""
+        with self._lock:
+            self._probing = False
+
+    def on_failure(self) -> None:
+        with self._lock:
+            self._consecutive_failures += 1
+            if self._probing or self._consecutive_failures >= self.failures:
+                if self._opened_at is None or self._probing:
+                    metrics.count("circuit_opened")
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+class HostPolicy:
+    def __init__(self, host: str, rate_share: float = 1.0):
+        rate, burst = HOST_RATES.get(host, DEFAULT_RATE)
+        self.bucket = TokenBucket(rate * rate_share, max(1, round(burst * rate_share)))
+        self.limit = AdaptiveLimit(MAX_CONCURRENCY, MIN_CONCURRENCY, MAX_CONCURRENCY)
+        self.breaker = CircuitBreaker(BREAKER_FAILURES, BREAKER_COOLDOWN)
+
+
+def get_retry_after(response: requests.Response) -> float | None:
+    """Seconds to wait according to the Retry-After header, if any."""
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        now = datetime.datetime.now(retry_at.tzinfo)
+        seconds = (retry_at - now).total_seconds()
+
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+
+def get_backoff(attempt: int) -> float:
+    """Full-jitter exponential backoff before retry number `attempt` (from 0)."""
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2**attempt))
+
+
+class HttpClient:
+    def __init__(
+        self,
+        get_session: Callable[[], requests.Session],
+        max_attempts: int = MAX_ATTEMPTS,
+    ):
+        self.get_session = get_session
+        self.max_attempts = max_attempts
+        self.rate_share = 1.0
+        self._policies: dict[str, HostPolicy] = {}
+        self._lock = threading.Lock()
+
+    def share_rate(self, processes: int) -> None:
+        """Use 1/`processes` of every host's rate, for one of several processes."""
+        with self._lock:
+            self.rate_share = 1 / processes
+            self._policies.clear()
+
+    def policy(self, url: str) -> HostPolicy:
+        host = urlsplit(url).hostname or ""
+        with self._lock:
+            if host not in self._policies:
+                self._policies[host] = HostPolicy(host, self.rate_share)
+            return self._policies[host]
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def head(self, url: str, **kwargs) -> requests.Response:
+        return self.request("HEAD", url, **kwargs)
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Send a request, retrying transient errors, 429 and 5xx responses.
+
+        Returns the last response once retries are exhausted, or raises the
+        last connection error if no response was received.
+        """
+        policy = self.policy(url)
+
+        for attempt in range(self.max_attempts):
+            policy.breaker.wait()
+            policy.bucket.acquire()
+
+            retry_after = None
+            try:
+                with policy.limit.slot():
+                    response = self.get_session().request(method, url, **kwargs)
+            except RETRY_ERRORS:
+                policy.breaker.on_failure()
+                if attempt + 1 == self.max_attempts:
+                    raise
+            except requests.RequestException:
+                policy.breaker.on_abort()
+                raise
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    policy.breaker.on_success()
+                    policy.limit.on_success()
+                    return response
+
+                policy.breaker.on_failure()
+                policy.limit.on_throttle()
+                metrics.count(f"http_{response.status_code}")
+                if attempt + 1 == self.max_attempts:
+                    return response
+                retry_after = get_retry_after(response)
+
+            metrics.count("http_retries")
+            time.sleep(max(get_backoff(attempt), retry_after or 0.0))
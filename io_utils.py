@@ -1,6 +1,55 @@
 from os import listdir
 from os.path import isfile, join
+from pathlib import Path
+from typing import Iterator
+import hashlib
+import json
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+BUSY_TIMEOUT = 60  # Seconds to wait for another process's write lock
 
 
 def get_files_from_folder(folder_name: str) -> list[str]:
     return [f for f in listdir(folder_name) if isfile(join(folder_name, f))]
+
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(path: str | Path, chunk_size: int = 1 << 20) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def append_line(path: str | Path, line: str) -> None:
+    """Append `line` to `path` durably, also when other processes append too.
+
+    The file is locked while writing, so lines of several processes (e.g.
+    queue workers) never interleave, and fsynced before returning.
+    """
+    with open(path, "a", encoding="utf-8") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)  # Released when the file is closed
+        f.write(line)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def iter_jsonl(path: str | Path) -> Iterator[dict]:
+    """Yield the records of a JSONL file written with `append_line`."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Line torn by a crash mid-append
+            yield record
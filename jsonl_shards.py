@@ -0,0 +1,116 @@
+"""
+Write many JSON records into a few rotating JSONL shards instead of one file
+per record.
+
+Records are serialised compactly, with orjson if it is installed, buffered,
+and written in batches to `part-00000.jsonl`, `part-00001.jsonl`, ... with
+at most `shard_size` records each (`.jsonl.gz` when compressed). Records are
+written in the order they are given, so shards are deterministic as long as
+the caller writes in a deterministic order (e.g. from `executor.map`).
+"""
+from pathlib import Path
+from typing import Iterator
+import gzip
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+SHARD_SIZE = 1000  # Records per shard
+BATCH_SIZE = 64  # Records buffered before a write
+COMPRESS_LEVEL = 6
+SHARD_PATTERN = "part-*.jsonl*"
+
+
+def dumps(record: dict) -> bytes:
+    """Serialise `record` as one compact line of UTF-8 JSON."""
+    if orjson is not None:
+        return orjson.dumps(record) + b"\n"
+
+    dump = json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+    return dump.encode("utf-8") + b"\n"
+
+
+def loads(line: bytes) -> dict:
+    if orjson is not None:
+        return orjson.loads(line)
+    return json.loads(line)
+
+
+class JsonlShardWriter:
+    def __init__(
+        self,
+        folder: str | Path,
+        shard_size: int = SHARD_SIZE,
+        compress: bool = False,
+        batch_size: int = BATCH_SIZE,
+    ):
+        """Existing shards in `folder` are replaced."""
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.shard_size = shard_size
+        self.compress = compress
+        self.batch_size = batch_size
+        self.records_written = 0
+        self._file = None
+        self._shard_records = 0
+        self._shards = 0
+        self._batch = []
+
+        for path in self.folder.glob(SHARD_PATTERN):
+            path.unlink()
+
+    def __enter__(self) -> "JsonlShardWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def write(self, record: dict) -> None:
+        self._batch.append(dumps(record))
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        batch, self._batch = self._batch, []
+
+        while batch:
+            if self._file is None or self._shard_records >= self.shard_size:
+                self._open_next_shard()
+
+            count = min(len(batch), self.shard_size - self._shard_records)
+            self._file.write(b"".join(batch[:count]))
+            self._shard_records += count
+            self.records_written += count
+            batch = batch[count:]
+
+    def _open_next_shard(self) -> None:
+        if self._file is not None:
+            self._file.close()
+
+        suffix = ".jsonl.gz" if self.compress else ".jsonl"
+        path = self.folder / f"part-{self._shards:05d}{suffix}"
+        if self.compress:
+            self._file = gzip.open(path, "wb", compresslevel=COMPRESS_LEVEL)
+        else:
+            self._file = open(path, "wb")
+
+        self._shards += 1
+        self._shard_records = 0
+
+    def close(self) -> None:
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def iter_shard_records(folder: str | Path) -> Iterator[dict]:
+    """Yield the records of every shard in `folder`, in the order written."""
+    for path in sorted(Path(folder).glob(SHARD_PATTERN)):
+        opener = gzip.open if path.suffix == ".gz" else open
+        with opener(path, "rb") as f:
+            for line in f:
+                yield loads(line)
@@ -0,0 +1,47 @@
+"""
+Persistent cache of resolved digital library PDF links.
+
+Resolving a digitallibrary.un.org record means checking that the record page
+is live before deriving the PDF link from the meeting name. Resolved links
+are appended to a JSONL file with the time they were resolved, so later
+crawls reuse them without any request until they are older than the TTL.
+"""
+from pathlib import Path
+import json
+import threading
+import time
+from io_utils import append_line, iter_jsonl
+
+LINK_CACHE_FILE = "link_cache.jsonl"
+LINK_TTL = 30 * 24 * 3600  # Seconds before a resolved link is checked again
+
+
+class LinkCache:
+    def __init__(self, path: str | Path = LINK_CACHE_FILE, ttl: float = LINK_TTL):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.links: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+        if self.path.exists():
+            self.load()
+
+    def load(self) -> None:
+        for record in iter_jsonl(self.path):
+            self.links[record["url"]] = record
+
+    def get(self, url: str) -> str | None:
+        """The PDF link resolved for record `url`, unless missing or expired."""
+        with self._lock:
+            record = self.links.get(url)
+
+        if record is None or time.time() - record["resolved_at"] > self.ttl:
+            return None
+        return record["pdf_link"]
+
+    def set(self, url: str, pdf_link: str) -> None:
+        record = {"url": url, "pdf_link": pdf_link, "resolved_at": time.time()}
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            append_line(self.path, line)
+            self.links[url] = record
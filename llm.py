@@ -1,28 +1,211 @@
-from sentence_transformers import SentenceTransformer
-from sentence_transformers.util import cos_sim
-from sentence_transformers.quantization import quantize_embeddings
+from contextlib import contextmanager
+from itertools import islice
+from typing import TYPE_CHECKING, Iterable, Iterator
+import os
+import threading
+import numpy as np
+from embedding_store import EMBEDDING_FOLDER, EmbeddingStore, hash_text
+from metrics import metrics
+
+if TYPE_CHECKING:
+    # Imported where used, so that importing this module does not load torch
+    from sentence_transformers import SentenceTransformer
 
 # 1. Specify preffered dimensions
 dimensions = 512
 
-# 2. load model
-model = SentenceTransformer(
-    "mixedbread-ai/mxbai-embed-large-v1", truncate_dim=dimensions
-)
+# Bulk embedding: texts per model.encode batch, and texts sorted together
+embedding_batch_size = 32
+embedding_bucket_size = 4096
+
+# 2. Configure model, it is only loaded on first use (see get_model)
+model_name = "mixedbread-ai/mxbai-embed-large-v1"
+
+# Optional CPU-optimised backend ("onnx" or "openvino") loaded from a local
+# export, e.g. one written by export_cpu_model:
+#   EMBEDDING_BACKEND=onnx EMBEDDING_MODEL_PATH=models/mxbai-onnx \
+#   EMBEDDING_MODEL_FILE=onnx/model_qint8_avx512_vnni.onnx
+backend = os.environ.get("EMBEDDING_BACKEND", "torch")
+model_path = os.environ.get("EMBEDDING_MODEL_PATH", model_name)
+model_file = os.environ.get("EMBEDDING_MODEL_FILE")
+
+# Identifies the embeddings in an EmbeddingStore, backends differ slightly
+model_id = model_name if backend == "torch" else f"{model_name}@{backend}:{model_file}"
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_model() -> "SentenceTransformer":
+    """Return the embedding model, loading it once even if called from threads."""
+    global _model
+
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from sentence_transformers import SentenceTransformer
+
+                kwargs = {"truncate_dim": dimensions}
+                if backend != "torch":
+                    kwargs["backend"] = backend
+                    if model_file:
+                        kwargs["model_kwargs"] = {"file_name": model_file}
+                _model = SentenceTransformer(model_path, **kwargs)
+
+    return _model
+
+
+def export_cpu_model(output_path: str, quantization_config: str = "avx512_vnni") -> str:
+    """Export the model to ONNX with int8 dynamic quantization.
+
+    Needs `optimum[onnxruntime]`. Returns the file name to use as
+    EMBEDDING_MODEL_FILE together with EMBEDDING_MODEL_PATH=output_path.
+    """
+    from sentence_transformers import SentenceTransformer
+    from sentence_transformers.backend import export_dynamic_quantized_onnx_model
+
+    onnx_model = SentenceTransformer(model_name, backend="onnx")
+    onnx_model.save_pretrained(output_path)
+    export_dynamic_quantized_onnx_model(onnx_model, quantization_config, output_path)
+    return f"onnx/model_qint8_{quantization_config}.onnx"
+
+
+def get_prompt(text: str, use_case: str = "clustering") -> str:
+    return f"Represent this sentence for {use_case}: {text}"
 
 
 def get_embedding(
     text: str, use_case: str = "clustering", quantize: bool = True
 ) -> str:
-    prompt = f"Represent this sentence for {use_case}: {text}"
-    embedding = model.encode(prompt)
+    from sentence_transformers.quantization import quantize_embeddings
+
+    prompt = get_prompt(text, use_case)
+    embedding = get_model().encode(prompt)
 
     if quantize:
-        return quantize_embeddings(embedding, precision="ubinary")
+        # quantize_embeddings expects a batch of embeddings
+        return quantize_embeddings(embedding[np.newaxis], precision="ubinary")[0]
 
     return embedding
 
 
+def get_embeddings(
+    texts: Iterable[str],
+    use_case: str = "clustering",
+    quantize: bool = True,
+    batch_size: int = embedding_batch_size,
+    bucket_size: int = embedding_bucket_size,
+    pool: dict | None = None,
+) -> Iterator[np.ndarray]:
+    """Embed many texts, yielding one embedding per text in input order.
+
+    Texts are read in buckets of `bucket_size`. Within a bucket they are
+    sorted by token length, so every batch of `batch_size` pads to similar
+    lengths, and quantized together. Pass a `pool` from `cpu_pool` to spread
+    the encoding over several processes.
+    """
+    from sentence_transformers.quantization import quantize_embeddings
+
+    texts = iter(texts)
+
+    while bucket := list(islice(texts, bucket_size)):
+        prompts = [get_prompt(text, use_case) for text in bucket]
+        token_ids = get_model().tokenizer(prompts, add_special_tokens=False)[
+            "input_ids"
+        ]
+        order = np.argsort([len(ids) for ids in token_ids], kind="stable")
+        sorted_prompts = [prompts[i] for i in order]
+
+        with metrics.timer("embedding"):
+            embeddings = get_model().encode(
+                sorted_prompts, batch_size=batch_size, pool=pool
+            )
+        metrics.count("texts_embedded", len(bucket))
+
+        if quantize:
+            embeddings = quantize_embeddings(embeddings, precision="ubinary")
+
+        # Undo the length sort
+        bucket_embeddings = np.empty_like(embeddings)
+        bucket_embeddings[order] = embeddings
+        yield from bucket_embeddings
+
+
+def open_embedding_store(folder: str = EMBEDDING_FOLDER) -> EmbeddingStore:
+    """Open the store for the embeddings of the configured model and backend."""
+    return EmbeddingStore(folder, model_id, dimensions)
+
+
+def get_cached_embeddings(
+    texts: Iterable[str],
+    store: EmbeddingStore,
+    use_case: str = "clustering",
+    quantize: bool = True,
+    bucket_size: int = embedding_bucket_size,
+    **kwargs,
+) -> Iterator[np.ndarray]:
+    """Like `get_embeddings`, but only texts missing from `store` are embedded.
+
+    New embeddings are added to the store, which must have been opened for
+    the configured model, backend and dimensions (see open_embedding_store).
+    The yielded vectors are read-only views into the store's memory maps.
+    """
+    if (store.model_name, store.dimensions) != (model_id, dimensions):
+        raise ValueError(
+            f"Store is for {store.model_name} with {store.dimensions} dimensions, "
+            f"but the model is {model_id} with {dimensions}"
+        )
+
+    from sentence_transformers.quantization import quantize_embeddings
+
+    texts = iter(texts)
+
+    while bucket := list(islice(texts, bucket_size)):
+        text_hashes = [hash_text(text) for text in bucket]
+        rows = store.lookup(text_hashes, use_case)
+        metrics.count("embedding_store_hits", sum(row is not None for row in rows))
+
+        missing = {}  # text hash -> text, deduplicated
+        for text_hash, text, row in zip(text_hashes, bucket, rows):
+            if row is None:
+                missing.setdefault(text_hash, text)
+
+        if missing:
+            embeddings = np.stack(
+                list(
+                    get_embeddings(
+                        missing.values(),
+                        use_case,
+                        quantize=False,
+                        bucket_size=bucket_size,
+                        **kwargs,
+                    )
+                )
+            )
+            binary = quantize_embeddings(embeddings, precision="ubinary")
+            new_rows = dict(
+                zip(missing, store.append(list(missing), use_case, embeddings, binary))
+            )
+            rows = [new_rows[h] if r is None else r for h, r in zip(text_hashes, rows)]
+
+        vectors = store.binary if quantize else store.floats
+        for row in rows:
+            yield vectors[row]
+
+
+@contextmanager
+def cpu_pool(processes: int | None = None) -> Iterator[dict]:
+    """Multi-process pool for `get_embeddings` on machines without a GPU."""
+    model = get_model()
+    pool = model.start_multi_process_pool(["cpu"] * (processes or os.cpu_count()))
+    try:
+        yield pool
+    finally:
+        model.stop_multi_process_pool(pool)
+
+
 # * Only for reference, can probably remove
 def get_similarity(embedding_1, embedding_2):
+    from sentence_transformers.util import cos_sim
+
     return cos_sim(embedding_1, embedding_2)
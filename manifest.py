@@ -0,0 +1,199 @@
+"""
+Append-only record of downloaded meetings and listing pages.
+
+Every successful download is appended to the manifest straight away, so a
+crashed crawl keeps everything it learned. A later run uses it to skip
+meetings already on disk and to send conditional requests (ETag /
+Last-Modified) for pages and PDFs it has seen before.
+
+Meetings whose download failed are appended to a separate retry queue, so
+the next run tries them again instead of losing them, up to
+MAX_RETRY_ATTEMPTS failures.
+"""
+from datetime import datetime
+from pathlib import Path
+from io_utils import append_line, hash_bytes, hash_file, iter_jsonl
+import csv
+import json
+import os
+import tempfile
+import threading
+
+MANIFEST_FILE = "manifest.jsonl"
+RETRY_QUEUE_FILE = "retry_queue.jsonl"
+MAX_RETRY_ATTEMPTS = 5  # Failed downloads of a meeting before it is given up
+MEETING_COLUMNS = ["name", "name_sanitized", "date", "pdf_link", "description"]
+
+
+def get_validators(response) -> dict[str, str]:
+    """Cache validators the server sent along with `response`."""
+    validators = {}
+    if etag := response.headers.get("ETag"):
+        validators["etag"] = etag
+    if last_modified := response.headers.get("Last-Modified"):
+        validators["last_modified"] = last_modified
+    return validators
+
+
+def conditional_headers(record: dict | None) -> dict[str, str]:
+    """Request headers turning a GET into a conditional GET for `record`."""
+    headers = {}
+    if not record:
+        return headers
+    if record.get("etag"):
+        headers["If-None-Match"] = record["etag"]
+    if record.get("last_modified"):
+        headers["If-Modified-Since"] = record["last_modified"]
+    return headers
+
+
+class Manifest:
+    def __init__(self, path: str | Path = MANIFEST_FILE):
+        self.path = Path(path)
+        self.meetings: dict[str, dict] = {}
+        self.pages: dict[str, dict] = {}
+        self._verified: set[str] = set()
+        self._lock = threading.Lock()
+
+        if self.path.exists():
+            self.load()
+
+    def load(self) -> None:
+        for record in iter_jsonl(self.path):
+            if record.get("kind") == "meeting":
+                self.meetings[record["name"]] = record
+            elif record.get("kind") == "page":
+                self.pages[record["url"]] = record
+
+    def _append(self, record: dict) -> None:
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            append_line(self.path, line)
+
+    def record_meeting(
+        self, meeting_dict: dict[str, str], path: str | Path, pdf_in_bytes: bytes
+    ) -> None:
+        record = {
+            **meeting_dict,
+            "kind": "meeting",
+            "path": str(path),
+            "size": len(pdf_in_bytes),
+            "sha256": hash_bytes(pdf_in_bytes),
+        }
+        self._append(record)
+        with self._lock:
+            self.meetings[record["name"]] = record
+            self._verified.add(record["name"])
+
+    def record_page(self, url: str, meeting_names: list[str], validators: dict) -> None:
+        record = {"kind": "page", "url": url, "meetings": meeting_names, **validators}
+        if self.pages.get(url) == record:
+            return
+
+        self._append(record)
+        with self._lock:
+            self.pages[url] = record
+
+    def is_on_disk(self, name: str) -> bool:
+        """True if `name` was downloaded and the file still matches its checksum."""
+        with self._lock:
+            record = self.meetings.get(name)
+            if name in self._verified:
+                return True
+
+        if record is None:
+            return False
+
+        path = Path(record["path"])
+        if not path.is_file() or path.stat().st_size != record["size"]:
+            return False
+        if hash_file(path) != record["sha256"]:
+            return False
+
+        with self._lock:
+            self._verified.add(name)
+        return True
+
+    def import_csv(self, csv_path: str | Path, folder: str | Path) -> int:
+        """Seed the manifest from a `meetings.csv` written by an older run."""
+        imported = 0
+        with open(csv_path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f, delimiter="|"):
+                path = Path(folder) / f"{row['name_sanitized']}.pdf"
+                if row["name"] in self.meetings or not path.is_file():
+                    continue
+
+                meeting_dict = {column: row.get(column) for column in MEETING_COLUMNS}
+                self.record_meeting(meeting_dict, path, path.read_bytes())
+                imported += 1
+
+        return imported
+
+
+class RetryQueue:
+    """Append-only log of failed downloads.
+
+    A meeting stays pending until it shows up in the manifest, i.e. until a
+    later download of it succeeds, or it failed `max_attempts` times.
+    """
+
+    def __init__(
+        self,
+        path: str | Path = RETRY_QUEUE_FILE,
+        max_attempts: int = MAX_RETRY_ATTEMPTS,
+    ):
+        self.path = Path(path)
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+
+    def add(self, meeting_dict: dict[str, str], reason: str) -> None:
+        record = {
+            **{column: meeting_dict.get(column) for column in MEETING_COLUMNS},
+            "reason": reason,
+            "failed_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            append_line(self.path, line)
+
+    def pending(self, manifest: Manifest) -> list[dict[str, str]]:
+        """Failed meetings which have not been downloaded since.
+
+        The log is compacted on the way: meetings in the manifest are
+        dropped, the others are kept as one record with their number of
+        "attempts". Meetings that failed `max_attempts` times stay in the log
+        but are no longer returned.
+        """
+        with self._lock:
+            if not self.path.exists():
+                return []
+
+            failed = {}
+            for record in iter_jsonl(self.path):
+                if record["name"] in manifest.meetings:
+                    continue
+                attempts = record.get("attempts", 1)
+                if previous := failed.get(record["name"]):
+                    attempts += previous["attempts"]
+                failed[record["name"]] = {**record, "attempts": attempts}
+
+            self._rewrite(failed.values())
+
+        return [
+            {column: record.get(column) for column in MEETING_COLUMNS}
+            for record in failed.values()
+            if record["attempts"] < self.max_attempts
+        ]
+
+    def _rewrite(self, records) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
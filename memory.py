@@ -0,0 +1,56 @@
+"""
+Resident memory (RSS) of the current process and a ceiling for it.
+
+RSS is read from /proc/self/statm, so it is only known on Linux; elsewhere
+`get_rss` returns None and no ceiling is enforced. Extraction workers check
+the ceiling after every page, so a document that would push a worker past
+it fails on its own instead of taking the node down.
+"""
+from pathlib import Path
+import os
+import fitz
+
+STATM = Path("/proc/self/statm")
+MIB = 1024**2
+
+
+class MemoryLimitExceeded(Exception):
+    pass
+
+
+def get_rss() -> int | None:
+    """Resident set size of this process in bytes, if known."""
+    try:
+        resident_pages = int(STATM.read_text().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return resident_pages * os.sysconf("SC_PAGE_SIZE")
+
+
+class MemoryCeiling:
+    """Tracks the peak RSS while a document is processed, up to `limit` bytes."""
+
+    def __init__(self, limit: int | None = None):
+        self.limit = limit
+        self.peak = get_rss() or 0
+
+    def check(self, what: str) -> None:
+        """Raise MemoryLimitExceeded if RSS is above the limit after `what`.
+
+        MuPDF's cache of fonts and images is emptied before giving up.
+        """
+        rss = get_rss()
+        if rss is None:
+            return
+
+        if self.limit is not None and rss > self.limit:
+            fitz.TOOLS.store_shrink(100)
+            rss = get_rss() or rss
+            if rss > self.limit:
+                self.peak = max(self.peak, rss)
+                raise MemoryLimitExceeded(
+                    f"RSS of {rss / MIB:.0f} MiB after {what} exceeds the "
+                    f"ceiling of {self.limit / MIB:.0f} MiB"
+                )
+
+        self.peak = max(self.peak, rss)
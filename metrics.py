@@ -0,0 +1,183 @@
+"""
+Lightweight per-stage timers and counters for scraping, extraction and
+embedding.
+
+Code under measurement wraps a stage in `metrics.timer("column_boxes")` or
+bumps `metrics.count("pdfs_downloaded")`; both only add a few dict updates
+under a lock, so they stay on in production. Work on one document is
+wrapped in `metrics.document(name)`: stages timed inside it are also summed
+per document, and documents slower than `slow_seconds` are kept in a slow-log
+(the SLOW_LOG_SIZE slowest ones). `metrics.memory(name, peak)` keeps the
+SLOW_LOG_SIZE documents with the highest peak RSS the same way.
+
+Worker processes hand `metrics.pop_snapshot()` back to the parent, which
+folds it in with `metrics.merge`. At the end of a run `metrics.write(prefix)`
+writes `<prefix>.json` and `<prefix>.prom` (Prometheus text format).
+"""
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+import heapq
+import itertools
+import json
+import threading
+import time
+
+SLOW_DOCUMENT_SECONDS = 5.0
+SLOW_LOG_SIZE = 100
+PROMETHEUS_PREFIX = "unsc"
+
+
+class Metrics:
+    def __init__(self, slow_seconds: float = SLOW_DOCUMENT_SECONDS):
+        self.slow_seconds = slow_seconds
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._sequence = itertools.count()  # Breaks ties in the slow-log heap
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.stages: dict[str, list[float]] = {}  # name -> [calls, total, max]
+            self.counters: dict[str, float] = {}
+            # Min-heap of (seconds, sequence, document, stages)
+            self.slow_log: list[tuple] = []
+            # Min-heap of (peak RSS bytes, sequence, document)
+            self.memory_log: list[tuple] = []
+
+    def observe(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            stats = self.stages.get(stage)
+            if stats is None:
+                self.stages[stage] = [1, seconds, seconds]
+            else:
+                stats[0] += 1
+                stats[1] += seconds
+                stats[2] = max(stats[2], seconds)
+
+        document_stages = getattr(self._local, "document_stages", None)
+        if document_stages is not None:
+            document_stages[stage] = document_stages.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def count(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextmanager
+    def document(self, name: str) -> Iterator[None]:
+        """Attribute the stages timed inside to document `name` for the slow-log."""
+        outer = getattr(self._local, "document_stages", None)
+        self._local.document_stages = stages = {}
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self._local.document_stages = outer
+            if seconds >= self.slow_seconds:
+                with self._lock:
+                    self._log_slow(seconds, name, stages)
+
+    def memory(self, name: str, peak_bytes: int) -> None:
+        """Record the peak RSS of the process while it worked on document `name`."""
+        with self._lock:
+            self._push(self.memory_log, (peak_bytes, next(self._sequence), name))
+
+    def _log_slow(self, seconds: float, name: str, stages: dict[str, float]) -> None:
+        self._push(self.slow_log, (seconds, next(self._sequence), name, stages))
+
+    @staticmethod
+    def _push(log: list[tuple], entry: tuple) -> None:
+        """Keep the SLOW_LOG_SIZE largest entries in the min-heap `log`."""
+        if len(log) < SLOW_LOG_SIZE:
+            heapq.heappush(log, entry)
+        elif entry > log[0]:
+            heapq.heapreplace(log, entry)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "stages": {
+                    stage: {"calls": calls, "seconds": total, "max_seconds": longest}
+                    for stage, (calls, total, longest) in sorted(self.stages.items())
+                },
+                "counters": dict(sorted(self.counters.items())),
+                "slow_documents": [
+                    {"document": name, "seconds": seconds, "stages": stages}
+                    for seconds, _, name, stages in sorted(self.slow_log, reverse=True)
+                ],
+                "largest_documents": [
+                    {"document": name, "peak_rss_bytes": peak}
+                    for peak, _, name in sorted(self.memory_log, reverse=True)
+                ],
+            }
+
+    def pop_snapshot(self) -> dict:
+        """Return the snapshot and reset, e.g. before a worker reports back."""
+        snapshot = self.snapshot()
+        self.reset()
+        return snapshot
+
+    def merge(self, snapshot: dict) -> None:
+        """Add a snapshot taken in another process."""
+        with self._lock:
+            for stage, stats in snapshot["stages"].items():
+                current = self.stages.setdefault(stage, [0, 0.0, 0.0])
+                current[0] += stats["calls"]
+                current[1] += stats["seconds"]
+                current[2] = max(current[2], stats["max_seconds"])
+
+            for name, value in snapshot["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+            for entry in snapshot["slow_documents"]:
+                self._log_slow(entry["seconds"], entry["document"], entry["stages"])
+
+            for entry in snapshot["largest_documents"]:
+                peak, name = entry["peak_rss_bytes"], entry["document"]
+                self._push(self.memory_log, (peak, next(self._sequence), name))
+
+    def to_prometheus(self) -> str:
+        snapshot = self.snapshot()
+        lines = []
+
+        for metric, field, kind in [
+            ("stage_calls_total", "calls", "counter"),
+            ("stage_seconds_total", "seconds", "counter"),
+            ("stage_seconds_max", "max_seconds", "gauge"),
+        ]:
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{metric} {kind}")
+            for stage, stats in snapshot["stages"].items():
+                lines.append(
+                    f'{PROMETHEUS_PREFIX}_{metric}{{stage="{stage}"}} {stats[field]}'
+                )
+
+        if snapshot["largest_documents"]:
+            peak = snapshot["largest_documents"][0]["peak_rss_bytes"]
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_document_peak_rss_bytes gauge")
+            lines.append(f"{PROMETHEUS_PREFIX}_document_peak_rss_bytes {peak}")
+
+        lines.append(f"# TYPE {PROMETHEUS_PREFIX}_events_total counter")
+        for name, value in snapshot["counters"].items():
+            lines.append(f'{PROMETHEUS_PREFIX}_events_total{{name="{name}"}} {value}')
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, prefix: str | Path) -> None:
+        """Write `<prefix>.json` and `<prefix>.prom`."""
+        with open(f"{prefix}.json", "w") as f:
+            json.dump(self.snapshot(), f, indent=4)
+        with open(f"{prefix}.prom", "w") as f:
+            f.write(self.to_prometheus())
+
+
+# Shared by all modules of a process
+metrics = Metrics()
@@ -51,30 +51,417 @@ Usage
       print(page.get_text(clip=rect, sort=True))
   ----------------------------------------------------------------------------------
 """
+from collections import defaultdict
+from typing import Iterator
+import math
 import sys
 import fitz
+from fitz import mupdf
+from metrics import metrics
+
+FOOTER_MARGIN = 80
+HEADER_MARGIN = 80
+BAND_HEIGHT = 20  # Height of the horizontal bands used by RectIndex
+PV_PAGE_SIZES = [(612, 792), (595, 842)]  # US letter and A4, in points
+PAGE_SIZE_TOLERANCE = 2
+WORD_LINE_TOLERANCE = 3  # As in fitz's get_text(sort=True)
+EMPTY_BBOX = (
+    fitz.FZ_MAX_INF_RECT,
+    fitz.FZ_MAX_INF_RECT,
+    fitz.FZ_MIN_INF_RECT,
+    fitz.FZ_MIN_INF_RECT,
+)
+LAYOUT_VERSION = 1  # Bump whenever a change alters get_page_text's output
+
+
+def layout_signature(
+    footer_margin: int = FOOTER_MARGIN,
+    header_margin: int = HEADER_MARGIN,
+    template: bool = True,
+) -> str:
+    """Identifies the output of `get_page_text` with these options, for caches."""
+    return f"l{LAYOUT_VERSION}-f{footer_margin}-h{header_margin}-t{int(template)}"
+
+
+def get_page_text(
+    page,
+    footer_margin: int = FOOTER_MARGIN,
+    header_margin: int = HEADER_MARGIN,
+    template: bool = True,
+    single_pass: bool = False,
+) -> list[str]:
+    """Return the text of every column box of `page`.
+
+    With template=True, standard two-column PV pages are laid out by
+    template_boxes, and only other pages by the general column_boxes.
+
+    With single_pass=True the page content is interpreted only once, into a
+    display list, instead of once for the layout and again for every box.
+    The text of each box is the same as page.get_text(clip=rect, sort=True).
+    """
+    display_list = None
+    if single_pass and page.rotation == 0:  # get_textpage lays these out unrotated
+        with metrics.timer("text_extraction"):
+            display_list = page.get_displaylist()
+
+    blocks = None
+    if template or display_list is not None:
+        with metrics.timer("text_extraction"):
+            clip = get_clip(page, footer_margin, header_margin)
+            blocks = get_blocks(page, clip, display_list)
+
+    bboxes = None
+    if template:
+        with metrics.timer("template_boxes"):
+            bboxes = template_boxes(page, blocks)
+        metrics.count("pages_template" if bboxes is not None else "pages_fallback")
+
+    if bboxes is None:
+        with metrics.timer("column_boxes"):
+            bboxes = column_boxes(
+                page,
+                footer_margin=footer_margin,
+                header_margin=header_margin,
+                no_image_text=True,
+                blocks=blocks,
+            )
+    page_text = []
+
+    with metrics.timer("text_extraction"):
+        for rect in bboxes:
+            if display_list is not None:
+                words = get_textpage(display_list, rect).extractWORDS()
+                text = get_sorted_text(words)
+            else:
+                text = page.get_text(clip=rect, sort=True)
+            page_text.append(text)
 
+    metrics.count("pages_laid_out")
+    return page_text
+
+
+def iter_pages(
+    doc,
+    footer_margin: int = FOOTER_MARGIN,
+    header_margin: int = HEADER_MARGIN,
+    start: int = 0,
+    template: bool = True,
+    single_pass: bool = False,
+) -> Iterator[list[str]]:
+    """Yield `get_page_text` for every page from `start` on, one page at a time."""
+    for page_number in range(start, doc.page_count):
+        yield get_page_text(
+            doc[page_number], footer_margin, header_margin, template, single_pass
+        )
 
-def get_pages(doc) -> list[str]:
-    pages = []
 
-    for page in doc:
-        bboxes = column_boxes(
-            page, footer_margin=80, header_margin=80, no_image_text=True
+def get_pages(
+    doc,
+    footer_margin: int = FOOTER_MARGIN,
+    header_margin: int = HEADER_MARGIN,
+    template: bool = True,
+    single_pass: bool = False,
+) -> list[list[str]]:
+    """Return the text of every column box, grouped by page."""
+    return list(
+        iter_pages(
+            doc,
+            footer_margin,
+            header_margin,
+            template=template,
+            single_pass=single_pass,
         )
-        page_text = []
+    )
 
-        for rect in bboxes:
-            text = page.get_text(clip=rect, sort=True)
-            page_text.append(text)
 
-        pages.append(page_text)
+def _text_bbox(block):
+    """The bbox column_boxes uses for a text block, as an (x0, y0, x1, y1) tuple.
+
+    Same as uniting the IRects of the block's lines with more than one
+    character, but without creating fitz objects. None if there is no such line.
+    """
+    x0 = y0 = math.inf
+    x1 = y1 = -math.inf
+    for line in block["lines"]:
+        if len("".join([s["text"].strip() for s in line["spans"]])) < 2:
+            continue
+        lx0, ly0, lx1, ly1 = line["bbox"]
+        lx0, ly0 = math.floor(lx0), math.floor(ly0)
+        lx1, ly1 = math.ceil(lx1), math.ceil(ly1)
+        if lx0 >= lx1 or ly0 >= ly1:  # fitz skips empty rects in unions
+            continue
+        x0, y0 = min(x0, lx0), min(y0, ly0)
+        x1, y1 = max(x1, lx1), max(y1, ly1)
+
+    if x0 >= x1:
+        return None
+    return x0, y0, x1, y1
+
 
-    return pages
+def _stacked(bboxes):
+    """Return True if the bboxes, sorted by top, do not overlap vertically."""
+    return all(a[3] <= b[1] for a, b in zip(bboxes, bboxes[1:]))
 
 
-def column_boxes(page, footer_margin=50, header_margin=50, no_image_text=True):
-    """Determine bboxes which wrap a column."""
+def template_boxes(page, blocks):
+    """Column boxes of a standard two-column PV page, or None for other pages.
+
+    A page matches the template if it has a PV page size, no images, no
+    drawings near the text and every text block on one side of the gutter in
+    the middle of the page (a page with text on one side only, like the
+    end of a meeting, matches too). 'blocks' is the output of get_blocks()
+    for the page. The column_boxes of such a page are known without running
+    it: one box per column, the right one extended to the page border. Pages
+    on which column_boxes would lay out anything else (e.g. a left block
+    with nothing to its right, which it extends across the gutter) do not
+    match.
+    """
+    width, height = page.rect.width, page.rect.height
+    tolerance = PAGE_SIZE_TOLERANCE
+    if not any(
+        abs(width - w) <= tolerance and abs(height - h) <= tolerance
+        for w, h in PV_PAGE_SIZES
+    ):
+        return None
+    if page.get_images():
+        return None
+
+    gutter = width / 2
+    left, right = [], []
+    for b in blocks:
+        if b["lines"][0]["dir"] != (1, 0):  # column_boxes avoids vertical text
+            return None
+        bbox = _text_bbox(b)
+        if bbox is None:
+            continue
+        if bbox[2] < gutter:
+            left.append(bbox)
+        elif bbox[0] > gutter:
+            right.append(bbox)
+        else:
+            return None
+
+    columns = [column for column in (left, right) if column]
+    if not columns:
+        return None
+    for column in columns:
+        column.sort(key=lambda k: (k[1], k[0]))
+        if not _stacked(column):
+            return None
+
+    # Left blocks with no right block beside them would be extended
+    if left and right:
+        for _, y0, _, y1 in left:
+            if not any(r[1] < y1 and y0 < r[3] for r in right):
+                return None
+
+    # Drawings beside the text could be backgrounds or block extensions
+    top = min(column[0][1] for column in columns)
+    bottom = max(column[-1][3] for column in columns)
+    for path in page.get_cdrawings():
+        _, y0, _, y1 = path["rect"]
+        if y0 <= bottom + 1 and top - 1 <= y1:
+            return None
+
+    boxes = [
+        fitz.IRect(
+            min(b[0] for b in column),
+            column[0][1],
+            max(b[2] for b in column),
+            column[-1][3],
+        )
+        for column in columns
+    ]
+    # The right column (or a lone left one) extends to the page border
+    boxes[-1].x1 = int(width)
+
+    # Order of column_boxes: by top, unless the bottoms are within 10 points
+    if left and right and right[0][1] < left[0][1]:
+        if abs(boxes[0].y1 - boxes[1].y1) > 10:
+            boxes.reverse()
+    return boxes
+
+
+class RectIndex:
+    """Spatial index answering "does this rect intersect any indexed rect?".
+
+    Rectangles are bucketed into horizontal bands of BAND_HEIGHT points, so a
+    query only looks at the rectangles sharing a band with it. Entries are
+    keyed by their position in the list being indexed, which lets callers
+    mirror in-place list updates (replacing an item, setting it to None).
+    """
+
+    def __init__(self, rects, band_height=BAND_HEIGHT):
+        self.band_height = band_height
+        self.rects = {}
+        self.bands = defaultdict(set)
+        for key, rect in enumerate(rects):
+            if rect is not None:
+                self.add(key, rect)
+
+    def _bands(self, rect):
+        return range(
+            int(rect.y0 // self.band_height), int(rect.y1 // self.band_height) + 1
+        )
+
+    def add(self, key, rect):
+        self.rects[key] = rect
+        for band in self._bands(rect):
+            self.bands[band].add(key)
+
+    def remove(self, key):
+        rect = self.rects.pop(key, None)
+        if rect is None:
+            return
+        for band in self._bands(rect):
+            self.bands[band].discard(key)
+
+    def replace(self, key, rect):
+        self.remove(key)
+        if rect is not None:
+            self.add(key, rect)
+
+    def intersects(self, rect, ignore=None):
+        """Return True if rect intersects an indexed rect not equal to 'ignore'."""
+        seen = set()
+        for band in self._bands(rect):
+            for key in self.bands.get(band, ()):
+                if key in seen:
+                    continue
+                seen.add(key)
+                b = self.rects[key]
+                # cheap rejection of disjoint rects before the exact check
+                if b.x0 >= rect.x1 or rect.x0 >= b.x1 or b.y0 >= rect.y1:
+                    continue
+                if b != ignore and not (rect & b).is_empty:
+                    return True
+        return False
+
+
+def get_clip(page, footer_margin=50, header_margin=50):
+    """Return the page area between header and footer margin."""
+    clip = +page.rect
+    clip.y1 -= footer_margin  # Remove footer area
+    clip.y0 += header_margin  # Remove header area
+    return clip
+
+
+def get_blocks(page, clip, display_list=None):
+    """Return the text blocks ("dict" format, with spans) inside clip.
+
+    If given, 'display_list' (of the page) is replayed instead of the page.
+    """
+    if display_list is not None:
+        return get_textpage(display_list, clip).extractDICT()["blocks"]
+    return page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT, clip=clip)["blocks"]
+
+
+def get_textpage(display_list, clip, flags=fitz.TEXTFLAGS_TEXT):
+    """Return the TextPage page.get_textpage(clip, flags) makes, from a display list.
+
+    Like page.get_textpage, characters outside clip are left out one by one,
+    but the page content is not interpreted again.
+    """
+    textpage = mupdf.FzStextPage(mupdf.FzRect(*clip))
+    device = mupdf.fz_new_stext_device(textpage, mupdf.FzStextOptions(flags))
+    mupdf.fz_run_display_list(
+        display_list.this,
+        device,
+        mupdf.FzMatrix(),
+        mupdf.FzRect(mupdf.FzRect.Fixed_INFINITE),
+        mupdf.FzCookie(),
+    )
+    mupdf.fz_close_device(device)
+    return fitz.TextPage(textpage)
+
+
+def _union(a, b):
+    """Union of two (x0, y0, x1, y1) tuples, ignoring empty ones like fitz.Rect."""
+    if b[0] >= b[2] or b[1] >= b[3]:
+        return a
+    if a[0] >= a[2] or a[1] >= a[3]:
+        return b
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+
+def _group_lines(words, tolerance):
+    """Group sorted words into lines of words with similar top or bottom."""
+    lines = []
+    line = [words[0]]
+    lrect = words[0][:4]
+    for w in words[1:]:
+        if abs(lrect[1] - w[1]) <= tolerance or abs(lrect[3] - w[3]) <= tolerance:
+            line.append(w)
+            lrect = _union(lrect, w[:4])
+        else:
+            lines.append((lrect, line))
+            line = [w]
+            lrect = w[:4]
+    lines.append((lrect, line))
+    return lines
+
+
+def _line_text(x0, line):
+    """Join the words of a line, with spaces for the gaps between them."""
+    line.sort(key=lambda w: w[0])
+    text = ""
+    x1 = x0
+    for w in line:
+        dist = max(
+            int(round((w[0] - x1) / max(0, w[2] - w[0]) * len(w[4]))),
+            0 if (x1 == x0 or w[0] <= x1) else 1,
+        )
+        text += " " * dist + w[4]
+        x1 = w[2]
+    return text
+
+
+def get_sorted_text(words, tolerance=WORD_LINE_TOLERANCE):
+    """Return the text page.get_text(sort=True) makes of the words of a TextPage.
+
+    'words' is the output of TextPage.extractWORDS(). This follows
+    get_sorted_text and get_text_words(sort=True) of fitz's utils.py step by
+    step, but on tuples instead of fitz.Rect objects, which take most of
+    their time.
+    """
+    if not words:
+        return ""
+
+    # Sort words by line, then left to right, as get_text_words does
+    words = sorted(words, key=lambda w: (w[3], w[0]))
+    words = [
+        w
+        for _, line in _group_lines(words, tolerance)
+        for w in sorted(line, key=lambda w: w[0])
+    ]
+
+    totalbox = EMPTY_BBOX
+    for w in words:
+        totalbox = _union(totalbox, w[:4])
+
+    lines = [
+        (lrect, _line_text(totalbox[0], line))
+        for lrect, line in _group_lines(words, tolerance)
+    ]
+    lines.sort(key=lambda l: l[0][3])
+
+    text = lines[0][1]
+    y1 = lines[0][0][3]
+    for lrect, ltext in lines[1:]:
+        distance = min(int(round((lrect[1] - y1) / max(0, lrect[3] - lrect[1]))), 5)
+        text += "\n" * (distance + 1) + ltext
+        y1 = lrect[3]
+    return text
+
+
+def column_boxes(
+    page, footer_margin=50, header_margin=50, no_image_text=True, blocks=None
+):
+    """Determine bboxes which wrap a column.
+
+    'blocks' may hold the output of get_blocks() for the same margins, in
+    which case the page text is not extracted again.
+    """
     paths = page.get_drawings()
     bboxes = []
 
@@ -89,27 +476,22 @@ def column_boxes(page, footer_margin=50, header_margin=50, no_image_text=True):
     vert_bboxes = []
 
     # compute relevant page area
-    clip = +page.rect
-    clip.y1 -= footer_margin  # Remove footer area
-    clip.y0 += header_margin  # Remove header area
+    clip = get_clip(page, footer_margin, header_margin)
 
-    def can_extend(temp, bb, bboxlist):
+    def can_extend(temp, bb, bboxindex):
         """Determines whether rectangle 'temp' can be extended by 'bb'
-        without intersecting any of the rectangles contained in 'bboxlist'.
+        without intersecting any of the rectangles contained in 'bboxindex'.
 
-        Items of bboxlist may be None if they have been removed.
+        'bboxindex' is the RectIndex of a non-empty list of bboxes; items
+        removed from the list (set to None) must be removed from the index.
 
         Returns:
-            True if 'temp' has no intersections with items of 'bboxlist'.
+            True if 'temp' has no intersections with items of 'bboxindex'.
         """
-        for b in bboxlist:
-            if not intersects_bboxes(temp, vert_bboxes) and (
-                b == None or b == bb or (temp & b).is_empty
-            ):
-                continue
+        if intersects_bboxes(temp, vert_bboxes):
             return False
 
-        return True
+        return not bboxindex.intersects(temp, ignore=bb)
 
     def in_bbox(bb, bboxes):
         """Return 1-based number if a bbox contains bb, else return 0."""
@@ -118,6 +500,15 @@ def column_boxes(page, footer_margin=50, header_margin=50, no_image_text=True):
                 return i + 1
         return 0
 
+    backgrounds = {}
+
+    def in_path_bbox(bb):
+        """Memoized in_bbox(bb, path_bboxes)."""
+        key = tuple(bb)
+        if key not in backgrounds:
+            backgrounds[key] = in_bbox(bb, path_bboxes)
+        return backgrounds[key]
+
     def intersects_bboxes(bb, bboxes):
         """Return True if a bbox intersects bb, else return False."""
         for bbox in bboxes:
@@ -140,9 +531,12 @@ def column_boxes(page, footer_margin=50, header_margin=50, no_image_text=True):
         Returns:
             Potentially modified bboxes.
         """
+        bboxindex = RectIndex(bboxes)
+        blocking_bboxes = path_bboxes + vert_bboxes + img_bboxes
+
         for i, bb in enumerate(bboxes):
             # do not extend text with background color
-            if in_bbox(bb, path_bboxes):
+            if in_path_bbox(bb):
                 continue
 
             # do not extend text in images
@@ -154,13 +548,14 @@ def column_boxes(page, footer_margin=50, header_margin=50, no_image_text=True):
             temp.x1 = width
 
             # do not cut through colored background or images
-            if intersects_bboxes(temp, path_bboxes + vert_bboxes + img_bboxes):
+            if intersects_bboxes(temp, blocking_bboxes):
                 continue
 
             # also, do not intersect other text bboxes
-            check = can_extend(temp, bb, bboxes)
+            check = can_extend(temp, bb, bboxindex)
             if check:
                 bboxes[i] = temp  # replace with enlarged bbox
+                bboxindex.replace(i, temp)
 
         return [b for b in bboxes if b != None]
 
@@ -214,11 +609,8 @@ def column_boxes(page, footer_margin=50, header_margin=50, no_image_text=True):
         img_bboxes.extend(page.get_image_rects(item[0]))
 
     # blocks of text on page
-    blocks = page.get_text(
-        "dict",
-        flags=fitz.TEXTFLAGS_TEXT,
-        clip=clip,
-    )["blocks"]
+    if blocks is None:
+        blocks = get_blocks(page, clip)
 
     # Make block rectangles, ignoring non-horizontal text
     for b in blocks:
@@ -246,7 +638,7 @@ def column_boxes(page, footer_margin=50, header_margin=50, no_image_text=True):
             bboxes.append(bbox)
 
     # Sort text bboxes by ascending background, top, then left coordinates
-    bboxes.sort(key=lambda k: (in_bbox(k, path_bboxes), k.y0, k.x0))
+    bboxes.sort(key=lambda k: (in_path_bbox(k), k.y0, k.x0))
 
     # Extend bboxes to the right where possible
     bboxes = extend_right(
@@ -264,6 +656,10 @@ def column_boxes(page, footer_margin=50, header_margin=50, no_image_text=True):
     nblocks = [bboxes[0]]  # pre-fill with first bbox
     bboxes = bboxes[1:]  # remaining old bboxes
 
+    # spatial indexes mirroring nblocks and bboxes
+    nblockindex = RectIndex(nblocks)
+    bboxindex = RectIndex(bboxes)
+
     for i, bb in enumerate(bboxes):  # iterate old bboxes
         check = False  # indicates unwanted joins
 
@@ -276,11 +672,11 @@ def column_boxes(page, footer_margin=50, header_margin=50, no_image_text=True):
                 continue
 
             # never join across different background colors
-            if in_bbox(nbb, path_bboxes) != in_bbox(bb, path_bboxes):
+            if in_path_bbox(nbb) != in_path_bbox(bb):
                 continue
 
             temp = bb | nbb  # temporary extension of new block
-            check = can_extend(temp, nbb, nblocks)
+            check = can_extend(temp, nbb, nblockindex)
             if check == True:
                 break
 
@@ -288,14 +684,18 @@ def column_boxes(page, footer_margin=50, header_margin=50, no_image_text=True):
             nblocks.append(bb)  # so add it to the list
             j = len(nblocks) - 1  # index of it
             temp = nblocks[j]  # new bbox added
+            nblockindex.add(j, bb)
 
         # check if some remaining bbox is contained in temp
-        check = can_extend(temp, bb, bboxes)
+        check = can_extend(temp, bb, bboxindex)
         if check == False:
             nblocks.append(bb)
+            nblockindex.add(len(nblocks) - 1, bb)
         else:
             nblocks[j] = temp
+            nblockindex.replace(j, temp)
         bboxes[i] = None
+        bboxindex.remove(i)
 
     # do some elementary cleaning
     nblocks = clean_nblocks(nblocks)
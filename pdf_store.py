@@ -0,0 +1,202 @@
+"""
+Content-addressed store for downloaded PDFs.
+
+Every distinct PDF is kept once, under `objects/<sha256[:2]>/<sha256>.pdf`,
+and `names.jsonl` maps meeting file names (name_sanitized) to the hash of
+their current content. `source/<name_sanitized>.pdf` stays where the rest of
+the pipeline expects it, but is a hard link to the object (a copy where the
+file system does not support links), so re-issued documents, duplicate
+records and re-crawls take the disk space once. Objects and links are
+written to a temporary file and moved into place with `os.replace`, so a
+crash never leaves a half-written PDF behind. Files in `source` must
+therefore be replaced, never written into, or the object changes with them.
+
+    python pdf_store.py import source
+    python pdf_store.py stats
+"""
+from pathlib import Path
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import threading
+from io_utils import (
+    append_line,
+    get_files_from_folder,
+    hash_bytes,
+    hash_file,
+    iter_jsonl,
+)
+from metrics import metrics
+
+STORE_FOLDER = "pdf_store"
+NAMES_FILE = "names.jsonl"
+
+
+def _replace_with_link(source: Path, target: Path) -> None:
+    """Atomically make `target` a hard link to `source`, or a copy of it."""
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=target.parent, suffix=".tmp")
+    os.close(fd)
+    try:
+        os.unlink(tmp_path)
+        try:
+            os.link(source, tmp_path)
+        except OSError:  # Different file system, or no hard links
+            shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, target)
+    finally:
+        # Also left behind if `target` already was a link to `source`, since
+        # renaming onto a link to the same file does nothing
+        Path(tmp_path).unlink(missing_ok=True)
+
+
+class PdfStore:
+    def __init__(self, folder: str | Path = STORE_FOLDER):
+        self.folder = Path(folder)
+        self.objects = self.folder / "objects"
+        self.objects.mkdir(parents=True, exist_ok=True)
+        self.names_path = self.folder / NAMES_FILE
+        self.names: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+        if self.names_path.exists():
+            self.load()
+
+    def load(self) -> None:
+        for record in iter_jsonl(self.names_path):
+            self.names[record["name"]] = record["sha256"]
+
+    def _append(self, record: dict) -> None:
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        append_line(self.names_path, line)
+
+    def object_path(self, sha256: str) -> Path:
+        return self.objects / sha256[:2] / f"{sha256}.pdf"
+
+    def hash_of(self, name: str) -> str | None:
+        """SHA-256 of the current content of `name`, if it is in the store."""
+        with self._lock:
+            return self.names.get(name)
+
+    def put(self, pdf_in_bytes: bytes) -> str:
+        """Store `pdf_in_bytes` unless already present, returning its hash."""
+        sha256 = hash_bytes(pdf_in_bytes)
+        path = self.object_path(sha256)
+        if path.exists():
+            metrics.count("pdf_store_duplicates")
+            return sha256
+
+        path.parent.mkdir(exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        os.fchmod(fd, 0o644)  # mkstemp creates files readable by the owner only
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(pdf_in_bytes)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+        metrics.count("pdf_store_objects_added")
+        return sha256
+
+    def add(self, name: str, pdf_in_bytes: bytes, link_path: str | Path) -> str:
+        """Store the PDF `name` and link it to `link_path`, returning its hash.
+
+        Nothing is written if `name` already has this content and
+        `link_path` points at it.
+        """
+        sha256 = self.put(pdf_in_bytes)
+        link_path = Path(link_path)
+        changed = self._record(name, sha256)
+        if changed or not self._is_linked(sha256, link_path):
+            _replace_with_link(self.object_path(sha256), link_path)
+        return sha256
+
+    def _record(self, name: str, sha256: str) -> bool:
+        """Map `name` to `sha256`, returning False if it already was."""
+        with self._lock:
+            if self.names.get(name) == sha256:
+                return False
+            self._append({"name": name, "sha256": sha256})
+            self.names[name] = sha256
+        return True
+
+    def linked_hash(self, path: str | Path) -> str | None:
+        """Hash of the PDF at `path` if it still is a link to its object."""
+        path = Path(path)
+        sha256 = self.hash_of(path.stem)
+        if sha256 is None or not self._is_linked(sha256, path):
+            return None
+        return sha256
+
+    def _is_linked(self, sha256: str, path: Path) -> bool:
+        try:
+            return os.path.samefile(self.object_path(sha256), path)
+        except OSError:
+            return False
+
+    def import_folder(self, folder: str | Path) -> int:
+        """Move the PDFs of `folder` into the store, returning how many.
+
+        Each file is replaced by a link to its object, so duplicates already
+        on disk are collapsed into one copy.
+        """
+        imported = 0
+        for filename in sorted(get_files_from_folder(folder)):
+            if not filename.endswith(".pdf"):
+                continue
+            path = Path(folder) / filename
+            sha256 = hash_file(path)
+            if self.hash_of(path.stem) == sha256 and self._is_linked(sha256, path):
+                continue
+
+            object_path = self.object_path(sha256)
+            if not object_path.exists():
+                object_path.parent.mkdir(exist_ok=True)
+                _replace_with_link(path, object_path)
+            self._record(path.stem, sha256)
+            _replace_with_link(object_path, path)
+            imported += 1
+
+        return imported
+
+    def stats(self) -> dict[str, int]:
+        objects = list(self.objects.glob("*/*.pdf"))
+        object_bytes = sum(path.stat().st_size for path in objects)
+        with self._lock:
+            names = dict(self.names)
+        referenced_bytes = sum(
+            self.object_path(sha256).stat().st_size
+            for sha256 in names.values()
+            if self.object_path(sha256).exists()
+        )
+        return {
+            "names": len(names),
+            "objects": len(objects),
+            "object_bytes": object_bytes,
+            "bytes_saved": max(referenced_bytes - object_bytes, 0),
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Content-addressed PDF store")
+    parser.add_argument("--store", default=STORE_FOLDER, help="Store folder")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="Move a folder into the store")
+    import_parser.add_argument("folder", nargs="?", default="source")
+
+    commands.add_parser("stats", help="Count names, objects and bytes saved")
+    args = parser.parse_args()
+
+    store = PdfStore(args.store)
+    if args.command == "import":
+        print(f"Imported {store.import_folder(args.folder)} PDFs from {args.folder}")
+    else:
+        for key, value in store.stats().items():
+            print(f"{key:<16} {value}")
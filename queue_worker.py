@@ -0,0 +1,264 @@
+"""
+Crawl and extract through a shared WorkQueue, so the work can be split
+across worker processes and nodes.
+
+Three kinds of tasks feed each other:
+- "listing": fetch a listing page and queue a "download" per meeting on it,
+- "download": download a meeting's PDF into the source folder and queue an
+  "extract" for it,
+- "extract": extract a PDF into the output folder, as extract.py does.
+
+Typical use on several nodes, with the queue file and folders on a shared
+disk (pass --shared-disk to every command, see work_queue.py):
+
+    python queue_worker.py seed --pages 210 --shared-disk
+    python queue_worker.py work --processes 8 --shared-disk   # on every node
+    python queue_worker.py status --shared-disk
+"""
+
+from multiprocessing import Process
+from pathlib import Path
+import argparse
+import os
+import socket
+import time
+import traceback
+import scrape_un_sc
+from cache import CACHE_FOLDER
+from catalog import Catalog
+from io_utils import get_files_from_folder
+from link_cache import LinkCache
+from manifest import Manifest, conditional_headers
+from pdf_store import PdfStore
+from scrape_un_sc import BASE_URL, client, fetch_pdf, get_meetings, save_pdf
+from work_queue import QUEUE_FILE, LEASE_SECONDS, WorkQueue
+
+KINDS = ["listing", "download", "extract"]  # Also the order tasks are taken in
+LISTING_PAGES = 210  # Everything within the last 25 years (as of 23.03.2024)
+POLL_SECONDS = 1.0  # Wait before asking again while other workers hold tasks
+
+
+def seed_listing_pages(queue: WorkQueue, pages: int = LISTING_PAGES) -> int:
+    return sum(
+        queue.put("listing", f"{BASE_URL}{i}", {"url": f"{BASE_URL}{i}"})
+        for i in range(1, pages + 1)
+    )
+
+
+def seed_source_files(queue: WorkQueue, source_folder: str) -> int:
+    """Queue an extraction for every PDF already in `source_folder`."""
+    return sum(
+        queue.put("extract", filename, {"filename": filename})
+        for filename in sorted(get_files_from_folder(source_folder))
+    )
+
+
+class Worker:
+    def __init__(
+        self,
+        queue: WorkQueue,
+        source_folder: str = scrape_un_sc.FOLDER,
+        extracted_folder: str = "extracted",
+        cache_folder: str | None = CACHE_FOLDER,
+    ):
+        self.queue = queue
+        self.source_folder = source_folder
+        self.extracted_folder = Path(extracted_folder)
+        self.cache_folder = cache_folder
+        self.name = f"{socket.gethostname()}-{os.getpid()}"
+        self._manifest = None
+        self._link_cache = None
+        self._store = None
+        self._catalog = None
+
+    @property
+    def catalog(self) -> Catalog:
+        if self._catalog is None:
+            self._catalog = Catalog()
+        return self._catalog
+
+    def handle_listing(self, payload: dict) -> None:
+        response = client.get(payload["url"])
+        if response.status_code != 200:
+            raise RuntimeError(f"Listing page returned {response.status_code}")
+
+        for meeting_dict in get_meetings(response):
+            self.queue.put("download", meeting_dict["name"], meeting_dict)
+
+    def handle_download(self, meeting_dict: dict) -> None:
+        if self._manifest is None:
+            self._manifest = Manifest()
+            self._link_cache = LinkCache()
+            self._store = PdfStore()
+            Path(self.source_folder).mkdir(exist_ok=True)
+
+        headers = None
+        if self._manifest.is_on_disk(meeting_dict["name"]):
+            headers = conditional_headers(self._manifest.meetings[meeting_dict["name"]])
+
+        # Raises if the download failed, so the task is retried
+        pdf_in_bytes = fetch_pdf(meeting_dict, headers, self._link_cache)
+        if pdf_in_bytes is not None:  # Else not modified since the last download
+            pdf_filename = save_pdf(
+                meeting_dict, pdf_in_bytes, self.source_folder, self._store
+            )
+            self._manifest.record_meeting(meeting_dict, pdf_filename, pdf_in_bytes)
+            self.catalog.record_download(meeting_dict, pdf_filename)
+
+        filename = f"{meeting_dict['name_sanitized']}.pdf"
+        self.queue.put("extract", filename, {"filename": filename})
+
+    def handle_extract(self, payload: dict) -> None:
+        # Only extraction needs fitz, so download-only workers start faster
+        from extract import _get_caches, extract_file, write_report
+
+        caches = _get_caches(self.cache_folder) if self.cache_folder else (None, None)
+        path = f"{self.source_folder}/{payload['filename']}"
+        try:
+            report_dict = extract_file(path, *caches)
+        except Exception:
+            self.catalog.record_extraction(path, None, traceback.format_exc())
+            raise
+        self.catalog.record_extraction(path, report_dict)
+
+        self.extracted_folder.mkdir(exist_ok=True)
+        output_path = self.extracted_folder / f"{Path(path).stem}.json"
+        write_report(report_dict, output_path)
+
+    def run(self, kinds: list[str] = KINDS) -> int:
+        """Work on tasks of `kinds` until the queue is drained, returning how many.
+
+        Tasks of the other kinds are waited for too, since pending listings
+        and downloads still queue extractions.
+        """
+        handlers = {
+            "listing": self.handle_listing,
+            "download": self.handle_download,
+            "extract": self.handle_extract,
+        }
+        handled = 0
+
+        while True:
+            task = None
+            for kind in kinds:
+                if task := self.queue.lease(kind, self.name):
+                    break
+
+            if task is None:
+                if self.queue.is_drained(KINDS):
+                    return handled
+                time.sleep(POLL_SECONDS)
+                continue
+
+            try:
+                handlers[task["kind"]](task["payload"])
+            except Exception:
+                self.queue.fail(task, traceback.format_exc())
+            else:
+                self.queue.complete(task)
+            handled += 1
+
+
+def _run_worker_process(
+    queue_path: str, kinds: list[str], crawlers: int, **kwargs
+) -> None:
+    client.share_rate(crawlers)
+    queue = WorkQueue(
+        queue_path,
+        kwargs.pop("lease_seconds"),
+        shared_disk=kwargs.pop("shared_disk"),
+    )
+    try:
+        Worker(queue, **kwargs).run(kinds)
+    finally:
+        queue.close()
+
+
+def run_workers(
+    queue_path: str,
+    processes: int,
+    kinds: list[str] = KINDS,
+    lease_seconds: float = LEASE_SECONDS,
+    shared_disk: bool = False,
+    nodes: int = 1,
+    **kwargs,
+) -> None:
+    """Run `processes` workers on this node and wait for them to finish.
+
+    The per-host request rates (see http_client.py) are split evenly between
+    the workers of all `nodes`, each assumed to run as many processes.
+    """
+    workers = [
+        Process(
+            target=_run_worker_process,
+            args=(queue_path, kinds, processes * nodes),
+            kwargs={
+                "lease_seconds": lease_seconds,
+                "shared_disk": shared_disk,
+                **kwargs,
+            },
+        )
+        for _ in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crawl and extract via a work queue")
+    parser.add_argument("command", choices=["seed", "seed-files", "work", "status"])
+    parser.add_argument("--queue", default=QUEUE_FILE, help="Work queue file")
+    parser.add_argument("--pages", type=int, default=LISTING_PAGES)
+    parser.add_argument("--source", default=scrape_un_sc.FOLDER, help="PDF folder")
+    parser.add_argument("--output", default="extracted", help="Output folder")
+    parser.add_argument("--cache", default=CACHE_FOLDER, help="Extraction cache")
+    parser.add_argument("--no-cache", action="store_true", help="Disable caching")
+    parser.add_argument(
+        "--kinds",
+        nargs="+",
+        choices=KINDS,
+        default=KINDS,
+        help="Task kinds this node works on",
+    )
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    parser.add_argument("--lease-seconds", type=float, default=LEASE_SECONDS)
+    parser.add_argument(
+        "--shared-disk",
+        action="store_true",
+        help="The queue is on a network disk shared by several nodes (no WAL)",
+    )
+    parser.add_argument(
+        "--nodes",
+        type=int,
+        default=1,
+        help="Number of nodes running workers, to split the request rate between",
+    )
+    args = parser.parse_args()
+
+    if args.command == "work":
+        scrape_un_sc.logger = scrape_un_sc.setup_logging()
+        run_workers(
+            args.queue,
+            args.processes,
+            args.kinds,
+            args.lease_seconds,
+            args.shared_disk,
+            args.nodes,
+            source_folder=args.source,
+            extracted_folder=args.output,
+            cache_folder=None if args.no_cache else args.cache,
+        )
+
+    queue = WorkQueue(args.queue, shared_disk=args.shared_disk)
+    if args.command == "seed":
+        print(f"Queued {seed_listing_pages(queue, args.pages)} listing pages")
+    elif args.command == "seed-files":
+        print(f"Queued {seed_source_files(queue, args.source)} PDFs for extraction")
+
+    for kind in KINDS:
+        print(f"{kind:<10} {queue.counts(kind)}")
+    for filename, error in queue.failed("extract").items():
+        print(f"Failed to extract {filename}:\n{error}")
+    queue.close()
@@ -1,24 +1,42 @@
 from pathlib import Path
 from bs4 import BeautifulSoup
-from typing import Iterator
-import pandas as pd
+from catalog import Catalog
+from http_client import HttpClient
+from link_cache import LinkCache
+from manifest import (
+    Manifest,
+    RetryQueue,
+    conditional_headers,
+    get_validators,
+)
+from metrics import metrics
+from pdf_store import PdfStore
+from queue import Queue
+from threading import Thread
+from typing import Iterable, Iterator
+import argparse
 import re
 import requests
-
+import threading
 
 BASE_URL = "https://www.securitycouncilreport.org/un_documents_type/security-council-meeting-records/page/"
 FOLDER = "source"
+MEETINGS_CSV = "meetings.csv"
+METRICS_PREFIX = "scrape_metrics"
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3"
 }
 RE_DIGITAL_LIBRARY = "https:\/\/digitallibrary\.un\.org\/record.+"
 RE_MISSING_FILE = "https?:\/\/daccess-ods\.un\.org\/tmp\/.+\.html"
+MAX_WORKERS = 8  # Concurrent PDF downloads
+QUEUE_SIZE = 64  # Meetings buffered between listing parser and downloaders
 
 import logging
 import sys
 
 logging.getLogger("requests").setLevel(logging.WARNING)
 logging.getLogger("urllib3").setLevel(logging.WARNING)
+logger = logging.getLogger()  # Configured by setup_logging when run as a script
 
 
 def setup_logging():
@@ -69,99 +87,396 @@ def get_meetings(response) -> list[dict[str, str]]:
     return meetings
 
 
-def get_pdf_link_from_digital_library(meeting: dict[str, str]) -> str:
+_thread_local = threading.local()
+_DONE = object()  # Sentinel marking the end of a queue
+
+
+def get_session() -> requests.Session:
+    """Return this thread's session, which keeps its connections alive.
+
+    A thread makes one request at a time, so the default pool of its session
+    (one kept-alive connection per host) is all it uses.
+    """
+    session = getattr(_thread_local, "session", None)
+
+    if session is None:
+        session = requests.Session()
+        session.headers.update(HEADERS)
+        _thread_local.session = session
+
+    return session
+
+
+# Rate limits, retries and circuit breaking per host, see http_client.py
+client = HttpClient(get_session)
+
+
+def is_live(url: str) -> bool:
+    """Check that `url` exists without downloading its body."""
+    response = client.head(url, allow_redirects=True)
+
+    if response.status_code in (405, 501):  # HEAD not supported
+        response = client.get(url, headers={"Range": "bytes=0-0"}, stream=True)
+        response.close()
+
+    return response.status_code in (200, 206)
+
+
+def get_pdf_link_from_digital_library(
+    meeting: dict[str, str], link_cache: LinkCache | None = None
+) -> str:
     link = meeting["pdf_link"]
 
-    with requests.Session() as session:
-        response = session.get(link, headers=HEADERS)
+    if link_cache is not None and (pdf_link := link_cache.get(link)):
+        metrics.count("link_cache_hits")
+        return pdf_link
 
-    if not response.status_code == 200:
-        return False
+    with metrics.timer("link_resolution"):
+        if not is_live(link):
+            return False
 
     base_link = link.split("?")[0]
     file_link_part = f"/files/{meeting['name_sanitized']}-EN.pdf"
 
     pdf_link = base_link + file_link_part
+    if link_cache is not None:
+        link_cache.set(link, pdf_link)
     return pdf_link
 
 
-def scrape_pdfs_from_un_security_council_page(
-    url: str,
-) -> Iterator[tuple[dict[str, str], bytes]]:
-    response = requests.get(url, headers=HEADERS)
+def get_meetings_from_page(url: str) -> list[dict[str, str]]:
+    with metrics.timer("listing_fetch"):
+        response = client.get(url)
 
     if not response.status_code == 200:
         logger.error(
             f"Failed to retrieve data from the website. Status code {response.status_code}"
             + f"url: {url}"
         )
+        return []
+
+    return get_meetings(response)
+
+
+def get_meetings_to_download(
+    url: str, manifest: Manifest, resume: bool = False
+) -> list[dict[str, str]] | None:
+    """Meetings listed on `url` which still need to be downloaded.
+
+    In resume mode meetings already on disk are skipped, and None is returned
+    once a page lists only known meetings so the caller can stop paging.
+    """
+    page_record = manifest.pages.get(url)
+    headers = {}
+    if (
+        resume
+        and page_record
+        and all(manifest.is_on_disk(name) for name in page_record["meetings"])
+    ):
+        headers = conditional_headers(page_record)
+
+    with metrics.timer("listing_fetch"):
+        response = client.get(url, headers=headers)
+
+    if response.status_code == 304:
         return None
 
+    if not response.status_code == 200:
+        logger.error(
+            f"Failed to retrieve data from the website. Status code {response.status_code}"
+            + f"url: {url}"
+        )
+        return []
+
     meetings = get_meetings(response)
+    manifest.record_page(
+        url, [meeting["name"] for meeting in meetings], get_validators(response)
+    )
+
+    if not resume:
+        return meetings
+
+    meetings = [m for m in meetings if not manifest.is_on_disk(m["name"])]
+    return meetings or None
+
+
+class DownloadError(Exception):
+    """A meeting's PDF could not be downloaded."""
+
+
+class MissingFileError(DownloadError):
+    """The meeting has no PDF, only a placeholder page, so retrying cannot help."""
+
+
+def fetch_pdf(
+    meeting_dict: dict[str, str],
+    headers: dict[str, str] | None = None,
+    link_cache: LinkCache | None = None,
+) -> bytes | None:
+    """Download the meeting's PDF, None if it is not modified.
+
+    Raises DownloadError, or the request's exception, if the download failed.
+    """
+    meeting_link = meeting_dict["pdf_link"]
+
+    if re.match(RE_MISSING_FILE, meeting_link):
+        raise MissingFileError(f"No PDF behind {meeting_link}")
+
+    if re.match(RE_DIGITAL_LIBRARY, meeting_link):
+        pdf_link = get_pdf_link_from_digital_library(meeting_dict, link_cache)
+        if not pdf_link:
+            raise DownloadError(f"Digital library record {meeting_link} is gone")
+        meeting_dict["pdf_link"] = pdf_link
+        logger.info(
+            f"Replaced link for {meeting_dict['name']}"
+        )  # TODO: don't use f-strings for logging
 
-    for meeting_dict in meetings:
-        meeting_link = meeting_dict["pdf_link"]
+    with metrics.timer("pdf_download"):
+        pdf_response = client.get(meeting_dict["pdf_link"], headers=headers)
 
-        if re.match(RE_MISSING_FILE, meeting_link):
-            logger.warning(f"FILE MISSING - Failed to download {meeting_dict['name']}")
-        elif re.match(RE_DIGITAL_LIBRARY, meeting_link):
-            meeting_dict["pdf_link"] = get_pdf_link_from_digital_library(meeting_dict)
-            logger.info(
-                f"Replaced link for {meeting_dict['name']}"
-            )  # TODO: don't use f-strings for logging
+    if pdf_response.status_code == 304:
+        logger.info(f"Not modified {meeting_dict['name']}")
+        metrics.count("pdfs_not_modified")
+        return None
+
+    if not pdf_response.status_code == 200:
+        raise DownloadError(f"HTTP {pdf_response.status_code}")
+
+    meeting_dict.update(get_validators(pdf_response))
+    metrics.count("pdfs_downloaded")
+    metrics.count("pdf_bytes", len(pdf_response.content))
+
+    logger.info(f"Successfully downloaded {meeting_dict['name']}")
+    return pdf_response.content
+
+
+def download_pdf(
+    meeting_dict: dict[str, str],
+    headers: dict[str, str] | None = None,
+    retry_queue: RetryQueue | None = None,
+    link_cache: LinkCache | None = None,
+) -> bytes | None:
+    """Download the meeting's PDF, None if it is not modified or failed.
+
+    Failed meetings are added to `retry_queue` as they were before this call.
+    Digital library links are resolved through `link_cache` if given.
+    """
+    original_meeting = dict(meeting_dict)
+
+    try:
+        return fetch_pdf(meeting_dict, headers, link_cache)
+    except MissingFileError:
+        logger.warning(f"FILE MISSING - Failed to download {meeting_dict['name']}")
+        metrics.count("pdfs_missing")
+        return None
+    except Exception as e:
+        logger.error(f"Error when querying pdf {meeting_dict['name']}")
+        logger.error("Error: %s", e)
+        metrics.count("pdf_download_errors")
+        if retry_queue is not None:
+            error = str(e) if isinstance(e, DownloadError) else repr(e)
+            retry_queue.add(original_meeting, error)
+        return None
+
+
+def scrape_pdfs_from_un_security_council_page(
+    url: str,
+) -> Iterator[tuple[dict[str, str], bytes]]:
+    for meeting_dict in get_meetings_from_page(url):
+        pdf_in_bytes = download_pdf(meeting_dict)
+
+        if pdf_in_bytes is not None:
+            yield (meeting_dict, pdf_in_bytes)
+
+
+def _produce_meetings(
+    urls: Iterable[str],
+    meeting_queue: Queue,
+    workers: int,
+    manifest: Manifest | None = None,
+    resume: bool = False,
+    retry_meetings: Iterable[dict[str, str]] = (),
+) -> None:
+    try:
+        retried = set()
+        for meeting_dict in retry_meetings:
+            retried.add(meeting_dict["name"])
+            meeting_queue.put(meeting_dict)
 
-        with requests.Session() as session:
+        for url in urls:
+            logger.info(f"============{url}============")
             try:
-                pdf_response = session.get(meeting_dict["pdf_link"], headers=HEADERS)
+                if manifest is None:
+                    meetings = get_meetings_from_page(url)
+                else:
+                    meetings = get_meetings_to_download(url, manifest, resume)
             except Exception as e:
-                logger.error(f"Error when querying pdf {meeting_dict['name']}")
+                logger.error(f"Error when querying page {url}")
                 logger.error("Error: %s", e)
                 continue
 
-        if not pdf_response.status_code == 200:
-            logger.warning(f"failed to query pdf {meeting_dict['name']}")
+            if meetings is None:
+                logger.info(f"Only known meetings on {url}, stopping")
+                break
+
+            for meeting_dict in meetings:
+                if meeting_dict["name"] not in retried:
+                    meeting_queue.put(meeting_dict)
+    finally:
+        for _ in range(workers):
+            meeting_queue.put(_DONE)
+
+
+def _consume_meetings(
+    meeting_queue: Queue,
+    result_queue: Queue,
+    manifest: Manifest | None = None,
+    retry_queue: RetryQueue | None = None,
+    link_cache: LinkCache | None = None,
+) -> None:
+    try:
+        while (meeting_dict := meeting_queue.get()) is not _DONE:
+            headers = None
+            if manifest is not None and manifest.is_on_disk(meeting_dict["name"]):
+                headers = conditional_headers(manifest.meetings[meeting_dict["name"]])
+
+            with metrics.document(meeting_dict["name"]):
+                pdf_in_bytes = download_pdf(
+                    meeting_dict, headers, retry_queue, link_cache
+                )
+
+            if pdf_in_bytes is not None:
+                result_queue.put((meeting_dict, pdf_in_bytes))
+    finally:
+        result_queue.put(_DONE)
+
+
+def scrape_pdfs_concurrently(
+    urls: Iterable[str],
+    max_workers: int = MAX_WORKERS,
+    manifest: Manifest | None = None,
+    resume: bool = False,
+    retry_queue: RetryQueue | None = None,
+    link_cache: LinkCache | None = None,
+) -> Iterator[tuple[dict[str, str], bytes]]:
+    """Download the PDFs of all meetings listed on `urls`.
+
+    One producer thread parses the listing pages and feeds a bounded queue of
+    meetings which `max_workers` threads download. Results are yielded in
+    completion order. With a `manifest`, meetings already on disk are fetched
+    conditionally (or skipped entirely when resuming). With a `retry_queue`,
+    its pending meetings are downloaded first and new failures are added.
+    """
+    retry_meetings = []
+    if retry_queue is not None and manifest is not None:
+        retry_meetings = retry_queue.pending(manifest)
+
+    meeting_queue = Queue(maxsize=QUEUE_SIZE)
+    result_queue = Queue(maxsize=QUEUE_SIZE)
+
+    threads = [
+        Thread(
+            target=_produce_meetings,
+            args=(urls, meeting_queue, max_workers, manifest, resume, retry_meetings),
+            daemon=True,
+        )
+    ]
+    threads += [
+        Thread(
+            target=_consume_meetings,
+            args=(meeting_queue, result_queue, manifest, retry_queue, link_cache),
+            daemon=True,
+        )
+        for _ in range(max_workers)
+    ]
+
+    for thread in threads:
+        thread.start()
+
+    finished = 0
+    while finished < max_workers:
+        result = result_queue.get()
+        if result is _DONE:
+            finished += 1
             continue
+        yield result
+
+
+def save_pdf(
+    meeting_dict: dict[str, str],
+    pdf_in_bytes: bytes,
+    folder: str,
+    store: PdfStore | None = None,
+) -> Path:
+    """Save the PDF to `folder` as a link into the content-addressed `store`."""
+    pdf_filename = Path(folder) / f"{meeting_dict['name_sanitized']}.pdf"
+    if store is None:
+        store = PdfStore()
 
-        logger.info(f"Successfully downloaded {meeting_dict['name']}")
-        yield (meeting_dict, pdf_response.content)
+    with metrics.timer("pdf_store"):
+        store.add(meeting_dict["name_sanitized"], pdf_in_bytes, pdf_filename)
+
+    return pdf_filename
 
 
 def download_pdfs_from_un_security_council_page(url: str, folder: str) -> None:
     meeting_dicts = []
+    store = PdfStore()
     for meeting_dict, pdf_in_bytes in scrape_pdfs_from_un_security_council_page(url):
-        pdf_filename = Path(folder) / f"{meeting_dict['name_sanitized']}.pdf"
-
-        with open(pdf_filename, "wb") as f:
-            f.write(pdf_in_bytes)
-
+        save_pdf(meeting_dict, pdf_in_bytes, folder, store)
         meeting_dicts.append(meeting_dict)
 
     return meeting_dicts
 
 
-def main():
-    meeting_dicts_all = []
+def main(max_workers: int = MAX_WORKERS, resume: bool = False):
+    Path(FOLDER).mkdir(exist_ok=True)
+
+    manifest = Manifest()
+    retry_queue = RetryQueue()
+    link_cache = LinkCache()
+    store = PdfStore()
+    catalog = Catalog()
+    if not manifest.meetings and Path(MEETINGS_CSV).exists():
+        imported = manifest.import_csv(MEETINGS_CSV, FOLDER)
+        logger.info(f"Imported {imported} meetings from {MEETINGS_CSV}")
+        # Their PDFs predate the store, link them into it for deduplication
+        store.import_folder(FOLDER)
+    # After import_csv, as the catalog rewrites meetings.csv at the end
+    catalog.import_manifest(manifest)
+
+    # Everything within the last 25 years (as of 23.03.2024)
+    urls = (f"{BASE_URL}{i}" for i in range(1, 211))
     try:
-        for i in range(
-            1, 211
-        ):  # Everything within the last 25 years (as of 23.03.2024)
-            logger.info(f"============PAGE {i}============")
-            url = f"{BASE_URL}{i}"
-            meeting_dicts_all += download_pdfs_from_un_security_council_page(
-                url, FOLDER
-            )
+        for meeting_dict, pdf_in_bytes in scrape_pdfs_concurrently(
+            urls, max_workers, manifest, resume, retry_queue, link_cache
+        ):
+            pdf_filename = save_pdf(meeting_dict, pdf_in_bytes, FOLDER, store)
+            manifest.record_meeting(meeting_dict, pdf_filename, pdf_in_bytes)
+            catalog.record_download(meeting_dict, pdf_filename)
     except Exception as e:
         logger.error(e)
     finally:
-        df = pd.DataFrame(meeting_dicts_all)
-        df.to_csv("meetings.csv", sep="|", index=False)
+        catalog.export_csv(MEETINGS_CSV)
+        catalog.close()
+        metrics.write(METRICS_PREFIX)
 
 
 # Example usage
 if __name__ == "__main__":
-    logger = setup_logging()
-    main()
+    parser = argparse.ArgumentParser(description="Download UN Security Council PDFs")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=MAX_WORKERS,
+        help="Number of concurrent PDF downloads",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip meetings already in the manifest and stop at the first known page",
+    )
+    args = parser.parse_args()
 
-# TODO:
-# Implement loading existing meetings.csv
-# Create source folder if not exists using pathlib
+    logger = setup_logging()
+    main(max_workers=args.workers, resume=args.resume)
@@ -0,0 +1,273 @@
+"""
+Full-text search over speeches, using SQLite FTS5.
+
+Every speech of an extracted report becomes one row, with its speaker, the
+speaker's country (resolved from the report's "members"), meeting number
+and date as filterable columns next to an FTS5 index of its text. The index
+is updated incrementally: reports whose file did not change since they were
+indexed are skipped, changed ones replace their old speeches.
+
+    python search_index.py update --input extracted
+    python search_index.py search "humanitarian corridor" --phrase --country France
+"""
+from functools import partial
+from pathlib import Path
+from typing import Callable, Iterator
+import argparse
+import json
+import sqlite3
+from io_utils import BUSY_TIMEOUT, get_files_from_folder, hash_bytes
+from jsonl_shards import SHARD_PATTERN, iter_shard_records
+from speakers import get_speaker_country
+from transcript import Transcript
+
+SEARCH_INDEX_FILE = "search.sqlite"
+COMMIT_EVERY = 200  # Reports indexed per transaction by update_from_folder
+SNIPPET_TOKENS = 16
+
+
+def file_signature(path: str | Path) -> str:
+    """Cheap signature of a JSON report, checked before the file is parsed."""
+    stat = Path(path).stat()
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+
+def record_signature(report_dict: dict) -> str:
+    """Signature of a whole report, so any change to it is indexed again."""
+    serialised = json.dumps(report_dict, ensure_ascii=False, sort_keys=True)
+    return hash_bytes(serialised.encode("utf-8"))
+
+
+def phrase_query(text: str) -> str:
+    """FTS5 query matching `text` as an exact phrase."""
+    return '"' + text.replace('"', '""') + '"'
+
+
+class SearchIndex:
+    def __init__(self, path: str | Path = SEARCH_INDEX_FILE):
+        self.path = Path(path)
+        self.db = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                document TEXT PRIMARY KEY,
+                signature TEXT NOT NULL,
+                type TEXT,
+                meeting_number TEXT,
+                date TEXT
+            );
+            CREATE TABLE IF NOT EXISTS speeches (
+                id INTEGER PRIMARY KEY,
+                document TEXT NOT NULL,
+                speech_index INTEGER NOT NULL,
+                speaker TEXT,
+                country TEXT COLLATE NOCASE,
+                meeting_number TEXT,
+                date TEXT
+            );
+            CREATE INDEX IF NOT EXISTS speeches_document ON speeches (document);
+            CREATE INDEX IF NOT EXISTS speeches_speaker ON speeches (speaker);
+            CREATE INDEX IF NOT EXISTS speeches_country ON speeches (country);
+            CREATE INDEX IF NOT EXISTS speeches_meeting ON speeches (meeting_number);
+            CREATE INDEX IF NOT EXISTS speeches_date ON speeches (date);
+            CREATE VIRTUAL TABLE IF NOT EXISTS speech_text USING fts5 (text);
+            """
+        )
+
+    def signature(self, document: str) -> str | None:
+        row = self.db.execute(
+            "SELECT signature FROM documents WHERE document = ?", (document,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _remove(self, document: str) -> None:
+        self.db.execute(
+            "DELETE FROM speech_text WHERE rowid IN "
+            "(SELECT id FROM speeches WHERE document = ?)",
+            (document,),
+        )
+        self.db.execute("DELETE FROM speeches WHERE document = ?", (document,))
+        self.db.execute("DELETE FROM documents WHERE document = ?", (document,))
+
+    def add(self, document: str, transcript: Transcript, signature: str) -> bool:
+        """Index the speeches of `transcript` unless unchanged since last time.
+
+        `document` names the report (its file name), `signature` identifies
+        its content. Call `commit` to make the changes visible to others.
+        """
+        if self.signature(document) == signature:
+            return False
+
+        self._remove(document)
+        metadata = transcript.metadata
+        members = metadata.get("members", {})
+        meeting_number = metadata.get("meeting_number")
+        date = metadata.get("date")
+
+        self.db.execute(
+            "INSERT INTO documents VALUES (?, ?, ?, ?, ?)",
+            (document, signature, metadata.get("type"), meeting_number, date),
+        )
+        for index, (speaker, text) in enumerate(transcript.speeches()):
+            cursor = self.db.execute(
+                "INSERT INTO speeches (document, speech_index, speaker, country, "
+                "meeting_number, date) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    document,
+                    index,
+                    speaker,
+                    get_speaker_country(speaker, members),
+                    meeting_number,
+                    date,
+                ),
+            )
+            self.db.execute(
+                "INSERT INTO speech_text (rowid, text) VALUES (?, ?)",
+                (cursor.lastrowid, text),
+            )
+        return True
+
+    def add_report(
+        self, document: str, report_dict: dict, path: str | Path | None = None
+    ) -> bool:
+        """Index a report straight from extraction, e.g. in extract_folder.
+
+        Pass the `path` of the JSON file it was written to, so that a later
+        `update_from_folder` does not index it again; without one the report
+        is signed by its content, as JSONL shard records are.
+        """
+        signature = file_signature(path) if path else record_signature(report_dict)
+        return self.add(document, Transcript(report_dict), signature)
+
+    def add_file(self, document: str, path: str | Path) -> bool:
+        """Index the report written to `path` unless unchanged since last time."""
+        signature = file_signature(path)
+        if self.signature(document) == signature:
+            return False
+        return self.add(document, Transcript.from_file(path), signature)
+
+    def commit(self) -> None:
+        self.db.commit()
+
+    def update_from_folder(self, folder: str | Path) -> int:
+        """Index new and changed reports in `folder`, returning how many."""
+        added = 0
+        for count, (document, signature, load) in enumerate(_iter_reports(folder), 1):
+            if self.signature(document) != signature:
+                added += self.add(document, load(), signature)
+            if count % COMMIT_EVERY == 0:
+                self.commit()
+
+        self.commit()
+        return added
+
+    def search(
+        self,
+        query: str,
+        speaker: str | None = None,
+        country: str | None = None,
+        meeting_number: str | None = None,
+        date_from: str | None = None,
+        date_to: str | None = None,
+        phrase: bool = False,
+        limit: int = 20,
+    ) -> list[dict]:
+        """Best matching speeches for an FTS5 `query`, optionally filtered.
+
+        With phrase=True, `query` is matched as an exact phrase. `speaker`
+        matches part of the speaker label, `country` the whole country name.
+        Dates are ISO strings; `date_to` includes the whole day.
+        """
+        conditions = ["speech_text MATCH ?"]
+        params = [phrase_query(query) if phrase else query]
+        if speaker is not None:
+            conditions.append("s.speaker LIKE ?")
+            params.append(f"%{speaker}%")
+        if country is not None:
+            conditions.append("s.country = ?")
+            params.append(country)
+        if meeting_number is not None:
+            conditions.append("s.meeting_number = ?")
+            params.append(str(meeting_number))
+        if date_from is not None:
+            conditions.append("s.date >= ?")
+            params.append(date_from)
+        if date_to is not None:
+            conditions.append("s.date < date(?, '+1 day')")
+            params.append(date_to)
+
+        rows = self.db.execute(
+            "SELECT s.document, s.speech_index, s.speaker, s.country, "
+            "s.meeting_number, s.date, "
+            f"snippet(speech_text, 0, '[', ']', '...', {SNIPPET_TOKENS}) AS snippet "
+            "FROM speech_text JOIN speeches AS s ON s.id = speech_text.rowid "
+            f"WHERE {' AND '.join(conditions)} ORDER BY rank LIMIT ?",
+            (*params, limit),
+        )
+        return [dict(row) for row in rows]
+
+    def close(self) -> None:
+        self.db.close()
+
+
+def _iter_reports(
+    folder: str | Path,
+) -> Iterator[tuple[str, str, Callable[[], Transcript]]]:
+    """Yield (document, signature, load) for every report in `folder`.
+
+    JSON reports are only parsed by `load`, so unchanged files cost a stat.
+    Records of JSONL shards are signed by their whole content.
+    """
+    folder = Path(folder)
+    if any(folder.glob(SHARD_PATTERN)):
+        for record in iter_shard_records(folder):
+            document = record.pop("file")
+            signature = record_signature(record)
+            yield document, signature, partial(Transcript, record)
+        return
+
+    for filename in sorted(get_files_from_folder(folder)):
+        if not filename.endswith(".json"):
+            continue
+        path = folder / filename
+        load = partial(Transcript.from_file, path)
+        yield path.stem, file_signature(path), load
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Full-text search over speeches")
+    parser.add_argument("--index", default=SEARCH_INDEX_FILE, help="Index file")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    update_parser = commands.add_parser("update", help="Index new reports")
+    update_parser.add_argument("--input", default="extracted", help="Reports")
+
+    search_parser = commands.add_parser("search", help="Search speeches")
+    search_parser.add_argument("query", help="FTS5 query, e.g. ceasefire NEAR/5 Gaza")
+    search_parser.add_argument("--phrase", action="store_true", help="Exact phrase")
+    search_parser.add_argument("--speaker", help="Part of the speaker label")
+    search_parser.add_argument("--country")
+    search_parser.add_argument("--meeting", help="Meeting number")
+    search_parser.add_argument("--from", dest="date_from", help="First date (ISO)")
+    search_parser.add_argument("--to", dest="date_to", help="Last date (ISO)")
+    search_parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    index = SearchIndex(args.index)
+    if args.command == "update":
+        print(f"Indexed {index.update_from_folder(args.input)} new or changed reports")
+    else:
+        for hit in index.search(
+            args.query,
+            args.speaker,
+            args.country,
+            args.meeting,
+            args.date_from,
+            args.date_to,
+            args.phrase,
+            args.limit,
+        ):
+            print(f"S/PV.{hit['meeting_number']} {hit['date']} {hit['speaker']}")
+            print(f"    {hit['snippet']}")
+    index.close()
@@ -0,0 +1,20 @@
+"""
+Speaker labels of the speeches, e.g. "Mr. Hoxha (Albania) (spoke in French)".
+
+Kept free of heavy imports, as the search index and the dataset export need
+it without loading the extraction code (and with it PyMuPDF).
+"""
+import re
+
+RE_SPEAKER_LANGUAGE = re.compile(r" ?\(spoke in [^)]*\)")
+RE_SPEAKER_LABEL_COUNTRY = re.compile(r" ?\(([^)]+)\)$")
+
+
+def get_speaker_country(speaker: str, members: dict[str, str]) -> str | None:
+    """Country of a "by_speaker" label, from the label itself or `members`."""
+    speaker = RE_SPEAKER_LANGUAGE.sub("", speaker).strip()
+
+    if country_match := RE_SPEAKER_LABEL_COUNTRY.search(speaker):
+        return country_match.group(1)
+
+    return members.get(speaker)
@@ -0,0 +1,28 @@
+from export_dataset import DatasetWriter, read_speeches
+from transcript import Transcript
+
+
+def make_transcript(year: int, speeches: int) -> Transcript:
+    return Transcript(
+        {
+            "meeting_number": f"{year}",
+            "date": f"{year}-01-01",
+            "type": "transcript",
+            "members": {},
+            "by_speaker": [
+                {"speaker": "The President", "text": "x" * 100} for _ in range(speeches)
+            ],
+        }
+    )
+
+
+def test_buffers_are_bounded_across_years(tmp_path):
+    writer = DatasetWriter(tmp_path, row_group_size=1_000, buffer_bytes=2_000)
+    for year in range(2000, 2010):
+        writer.write(make_transcript(year, 5))
+        assert writer._buffered_bytes <= 2_000
+        assert sum(len(rows) for rows in writer._buffers.values()) < 20
+    writer.close()
+
+    assert writer.rows_written == 50
+    assert read_speeches(tmp_path).num_rows == 50
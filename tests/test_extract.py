@@ -0,0 +1,41 @@
+import pytest
+from benchmark import make_pv_doc
+from extract import (
+    NormalizedText,
+    SpeakerSplitter,
+    iter_speaker_spans,
+    process_doc,
+    process_doc_streaming,
+    write_report,
+)
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_streamed_report_matches_write_report(tmp_path, compact):
+    doc, turns = make_pv_doc(seed=2, speech_pages=4, table_pages=1)
+    write_report(process_doc(doc, compact=compact), tmp_path / "batch.json", compact)
+    process_doc_streaming(doc, tmp_path / "streamed.json", compact)
+
+    assert turns > 0
+    streamed = (tmp_path / "streamed.json").read_bytes()
+    assert streamed == (tmp_path / "batch.json").read_bytes()
+
+
+def test_splitter_fed_in_pieces_matches_whole_text():
+    text = (
+        'Intro "quoted"\n\nThe President: Welcome.\nMr. Smith (France)'
+        " (spoke in French): Thank you,\n\n madam.  The President: Bye."
+    )
+    whole = NormalizedText()
+    expected = list(iter_speaker_spans(text, whole))
+
+    for size in [1, 2, 7, 30]:
+        pieced = NormalizedText()
+        splitter = SpeakerSplitter(pieced)
+        spans = []
+        for i in range(0, len(text), size):
+            spans.extend(splitter.feed(text[i : i + size]))
+        spans.extend(splitter.close())
+
+        assert spans == expected
+        assert pieced.getvalue() == whole.getvalue()
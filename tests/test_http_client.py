@@ -0,0 +1,37 @@
+import pytest
+import requests
+import http_client
+from http_client import HttpClient
+
+
+class FakeSession:
+    def __init__(self, error: Exception):
+        self.error = error
+        self.requests = 0
+
+    def request(self, method, url, **kwargs):
+        self.requests += 1
+        raise self.error
+
+
+def test_invalid_urls_are_not_retried():
+    session = FakeSession(requests.exceptions.MissingSchema("No scheme"))
+    client = HttpClient(lambda: session)
+
+    for _ in range(http_client.BREAKER_FAILURES + 1):
+        with pytest.raises(requests.exceptions.MissingSchema):
+            client.get("False")
+
+    assert session.requests == http_client.BREAKER_FAILURES + 1
+    assert client.policy("False").breaker._opened_at is None
+
+
+def test_connection_errors_are_retried(monkeypatch):
+    monkeypatch.setattr(http_client.time, "sleep", lambda seconds: None)
+    session = FakeSession(requests.ConnectionError("Connection refused"))
+    client = HttpClient(lambda: session, max_attempts=3)
+
+    with pytest.raises(requests.ConnectionError):
+        client.get("https://example.org/")
+
+    assert session.requests == 3
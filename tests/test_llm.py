@@ -0,0 +1,16 @@
+import pytest
+import llm
+from embedding_store import EmbeddingStore
+
+
+def test_store_of_another_model_is_rejected(tmp_path):
+    store = EmbeddingStore(tmp_path, llm.model_id, llm.dimensions // 2)
+
+    with pytest.raises(ValueError, match="dimensions"):
+        next(llm.get_cached_embeddings(["text"], store))
+
+
+def test_open_embedding_store_uses_the_configured_model(tmp_path):
+    store = llm.open_embedding_store(tmp_path)
+
+    assert (store.model_name, store.dimensions) == (llm.model_id, llm.dimensions)
@@ -0,0 +1,107 @@
+import random
+import fitz
+import pytest
+import multi_column
+from benchmark import make_pv_doc
+from multi_column import (
+    FOOTER_MARGIN,
+    HEADER_MARGIN,
+    RectIndex,
+    column_boxes,
+    get_blocks,
+    get_clip,
+    get_pages,
+    get_sorted_text,
+    get_textpage,
+    template_boxes,
+)
+
+
+@pytest.fixture(scope="module")
+def pv_doc():
+    doc, _ = make_pv_doc(seed=1, speech_pages=6, table_pages=2)
+    return doc
+
+
+@pytest.mark.parametrize("template", [True, False])
+def test_single_pass_text_matches_default(pv_doc, template):
+    assert get_pages(pv_doc, template=template, single_pass=True) == get_pages(
+        pv_doc, template=template
+    )
+
+
+def test_template_boxes_match_column_boxes(pv_doc):
+    matched = 0
+    for page in pv_doc:
+        blocks = get_blocks(page, get_clip(page, FOOTER_MARGIN, HEADER_MARGIN))
+        boxes = template_boxes(page, blocks)
+        if boxes is not None:
+            matched += 1
+            assert boxes == column_boxes(
+                page, FOOTER_MARGIN, HEADER_MARGIN, blocks=blocks
+            )
+    assert matched >= 6  # At least the speech pages take the fast path
+
+
+def test_template_text_matches_column_boxes(pv_doc):
+    assert get_pages(pv_doc) == get_pages(pv_doc, template=False)
+
+
+@pytest.fixture(scope="module")
+def uneven_page():
+    """Lines written bottom up, with words slightly above or below their line."""
+    doc = fitz.open()
+    page = doc.new_page()
+    for y in [500, 300, 120, 302.5, 496.5, 200]:
+        for x, offset in [(72, 0), (160, 2.5), (250, -3.5), (330, 1)]:
+            page.insert_text((x, y + offset), f"word{x}-{y}", fontsize=9 + x % 4)
+    return doc[0]
+
+
+def test_sorted_text_matches_get_text(pv_doc, uneven_page):
+    for page in [*pv_doc, uneven_page]:
+        display_list = page.get_displaylist()
+        width, height = page.rect.br
+        # Boxes cutting through words and lines, like overlapping columns do
+        for rect in [
+            page.rect,
+            fitz.Rect(0, 0, width / 2, height / 2),
+            fitz.Rect(width / 3, height / 3, width, height),
+            fitz.Rect(100.5, 207.3, 411.7, 523.9),
+        ]:
+            words = get_textpage(display_list, rect).extractWORDS()
+            assert get_sorted_text(words) == page.get_text(clip=rect, sort=True)
+
+
+class LinearScan(RectIndex):
+    """The intersection check column_boxes made before RectIndex."""
+
+    def intersects(self, rect, ignore=None):
+        return any(b != ignore and not (rect & b).is_empty for b in self.rects.values())
+
+
+def test_rect_index_matches_linear_scan():
+    rng = random.Random(0)
+
+    def random_rect():
+        x0, y0 = rng.uniform(0, 500), rng.uniform(0, 700)
+        return fitz.Rect(x0, y0, x0 + rng.uniform(0, 200), y0 + rng.uniform(0, 90))
+
+    rects = [random_rect() for _ in range(60)]
+    index, scan = RectIndex(rects), LinearScan(rects)
+    for key in range(0, 60, 3):  # Mirror in-place updates of the list
+        rect = random_rect() if key % 2 else None
+        index.replace(key, rect)
+        scan.replace(key, rect)
+
+    for _ in range(500):
+        rect = random_rect()
+        ignore = rng.choice([None, *scan.rects.values()])
+        assert index.intersects(rect, ignore) == scan.intersects(rect, ignore)
+
+
+def test_column_boxes_match_linear_scan(pv_doc, uneven_page, monkeypatch):
+    pages = [*pv_doc, uneven_page]
+    expected = [column_boxes(page, 80, 80) for page in pages]
+    monkeypatch.setattr(multi_column, "RectIndex", LinearScan)
+    assert [column_boxes(page, 80, 80) for page in pages] == expected
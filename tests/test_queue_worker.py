@@ -0,0 +1,65 @@
+import pytest
+import requests
+import queue_worker
+import scrape_un_sc
+from manifest import Manifest
+from queue_worker import Worker
+from scrape_un_sc import DownloadError
+from work_queue import WorkQueue
+
+MEETING = {
+    "name": "S/PV.9000",
+    "name_sanitized": "S_PV.9000",
+    "date": "1 January 2024",
+    "pdf_link": "https://documents.un.org/S_PV.9000-EN.pdf",
+    "description": "",
+}
+
+
+def respond(status_code):
+    def get(url, **kwargs):
+        response = requests.Response()
+        response.status_code = status_code
+        response._content = b""
+        return response
+
+    return get
+
+
+def test_worker_waits_for_upstream_tasks(tmp_path, monkeypatch):
+    queue = WorkQueue(tmp_path / "work_queue.sqlite")
+    queue.put("listing", "page-1", {"url": "https://example.org/1"})
+    listing = queue.lease("listing", "other-node")
+    polls = []
+
+    def other_node_finishes(seconds):
+        polls.append(seconds)
+        queue.complete(listing)
+
+    monkeypatch.setattr(queue_worker.time, "sleep", other_node_finishes)
+    worker = Worker(queue, str(tmp_path), str(tmp_path / "extracted"), None)
+
+    assert worker.run(["extract"]) == 0
+    assert len(polls) == 1
+    queue.close()
+
+
+@pytest.mark.parametrize("status_code", [304, 503])
+def test_download_of_known_meeting(tmp_path, monkeypatch, status_code):
+    monkeypatch.chdir(tmp_path)  # Manifest, link cache and store use the defaults
+    (tmp_path / "source").mkdir()
+    pdf_path = tmp_path / "source" / "S_PV.9000.pdf"
+    pdf_path.write_bytes(b"%PDF")
+    Manifest().record_meeting(MEETING, pdf_path, b"%PDF")
+    monkeypatch.setattr(scrape_un_sc.client, "get", respond(status_code))
+
+    queue = WorkQueue(tmp_path / "work_queue.sqlite")
+    worker = Worker(queue, "source", "extracted", None)
+    if status_code == 304:
+        worker.handle_download(dict(MEETING))
+        assert queue.counts("extract") == {"pending": 1}
+    else:
+        with pytest.raises(DownloadError):
+            worker.handle_download(dict(MEETING))
+        assert queue.counts("extract") == {}
+    queue.close()
@@ -0,0 +1,69 @@
+import requests
+import scrape_un_sc
+from manifest import Manifest, RetryQueue
+
+MEETING = {
+    "name": "S/PV.9000",
+    "name_sanitized": "S_PV.9000",
+    "date": "1 January 2024",
+    "pdf_link": "https://digitallibrary.un.org/record/1234?ln=en",
+    "description": "",
+}
+
+
+def test_failed_link_resolution_is_queued_for_retry(tmp_path, monkeypatch):
+    def resolve(meeting_dict, link_cache=None):
+        raise requests.ConnectionError("circuit open")
+
+    monkeypatch.setattr(scrape_un_sc, "get_pdf_link_from_digital_library", resolve)
+    retry_queue = RetryQueue(tmp_path / "retry_queue.jsonl")
+
+    meeting_dict = dict(MEETING)
+    assert scrape_un_sc.download_pdf(meeting_dict, retry_queue=retry_queue) is None
+
+    manifest = Manifest(tmp_path / "manifest.jsonl")
+    assert retry_queue.pending(manifest) == [MEETING]
+
+
+def test_missing_files_are_not_queued(tmp_path):
+    retry_queue = RetryQueue(tmp_path / "retry_queue.jsonl")
+    meeting_dict = {
+        **MEETING,
+        "pdf_link": "https://daccess-ods.un.org/tmp/1234567.89.html",
+    }
+
+    assert scrape_un_sc.download_pdf(meeting_dict, retry_queue=retry_queue) is None
+    assert not retry_queue.path.exists()
+
+
+def test_retry_queue_is_compacted(tmp_path):
+    retry_queue = RetryQueue(tmp_path / "retry_queue.jsonl", max_attempts=3)
+    manifest = Manifest(tmp_path / "manifest.jsonl")
+    downloaded = {**MEETING, "name": "S/PV.9001", "name_sanitized": "S_PV.9001"}
+
+    for _ in range(2):
+        retry_queue.add(MEETING, "HTTP 503")
+    retry_queue.add(downloaded, "HTTP 503")
+    manifest.record_meeting(downloaded, tmp_path / "S_PV.9001.pdf", b"%PDF")
+
+    assert retry_queue.pending(manifest) == [MEETING]
+    assert len(retry_queue.path.read_text().splitlines()) == 1
+
+    retry_queue.add(MEETING, "HTTP 503")
+    assert retry_queue.pending(manifest) == []
+
+
+def test_dead_records_are_queued_without_a_request(tmp_path, monkeypatch):
+    def resolve(meeting_dict, link_cache=None):
+        return False
+
+    def get(url, **kwargs):
+        raise AssertionError(f"Requested {url}")
+
+    monkeypatch.setattr(scrape_un_sc, "get_pdf_link_from_digital_library", resolve)
+    monkeypatch.setattr(scrape_un_sc.client, "get", get)
+    retry_queue = RetryQueue(tmp_path / "retry_queue.jsonl")
+
+    assert scrape_un_sc.download_pdf(dict(MEETING), retry_queue=retry_queue) is None
+    manifest = Manifest(tmp_path / "manifest.jsonl")
+    assert retry_queue.pending(manifest) == [MEETING]
@@ -0,0 +1,44 @@
+import pytest
+import work_queue
+from work_queue import WorkQueue
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(work_queue.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = WorkQueue(tmp_path / "work_queue.sqlite", lease_seconds=60)
+    yield queue
+    queue.close()
+
+
+def test_expired_lease_is_requeued(queue, clock):
+    queue.put("download", "S/PV.9000", {"name": "S/PV.9000"})
+    dead = queue.lease("download", "dead-node")
+
+    clock[0] += 59
+    assert queue.lease("download", "live-node") is None
+
+    clock[0] += 2
+    task = queue.lease("download", "live-node")
+    assert task["key"] == "S/PV.9000"
+    assert task["attempts"] == 2
+    assert not queue.complete(dead)
+    assert queue.complete(task)
+    assert queue.counts("download") == {"done": 1}
+
+
+def test_expired_lease_out_of_attempts_fails(queue, clock):
+    queue.max_attempts = 2
+    queue.put("download", "S/PV.9000", {"name": "S/PV.9000"})
+    for owner in ["node-1", "node-2"]:
+        assert queue.lease("download", owner) is not None
+        clock[0] += 61
+
+    assert queue.lease("download", "node-3") is None
+    assert queue.failed("download") == {"S/PV.9000": "lease expired"}
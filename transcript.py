@@ -0,0 +1,62 @@
+"""
+Reader for the reports written by extract.py.
+
+Compact reports (`extract.py --compact`) store the normalised transcript once
+in "text"; every "by_speaker" entry only holds "start"/"end" offsets into it.
+`Transcript` hides the difference: speeches are sliced from the text when
+they are accessed, and full reports are read as they are.
+"""
+from pathlib import Path
+from typing import Iterator
+import json
+
+
+class Transcript:
+    def __init__(self, report_dict: dict):
+        self.report = report_dict
+        self.text = report_dict.get("text", "")
+        self._by_speaker = report_dict.get("by_speaker", [])
+        self.compact = report_dict.get("format") == "compact"
+
+    @classmethod
+    def from_file(cls, path: str | Path) -> "Transcript":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    @property
+    def metadata(self) -> dict:
+        """Everything in the report except the speeches and the full text."""
+        excluded = ("by_speaker", "text", "format")
+        return {k: v for k, v in self.report.items() if k not in excluded}
+
+    def __len__(self) -> int:
+        return len(self._by_speaker)
+
+    def __getitem__(self, index: int) -> dict[str, str]:
+        part = self._by_speaker[index]
+        if self.compact:
+            return {"speaker": part["speaker"], "text": self.speech_text(index)}
+        return part
+
+    def speech_text(self, index: int) -> str:
+        part = self._by_speaker[index]
+        if self.compact:
+            return self.text[part["start"] : part["end"]]
+        return part["text"]
+
+    def speakers(self) -> list[str]:
+        return [part["speaker"] for part in self._by_speaker]
+
+    def speeches(self) -> Iterator[tuple[str, str]]:
+        """Yield (speaker, text) per speech, slicing texts only when reached."""
+        for index, part in enumerate(self._by_speaker):
+            yield part["speaker"], self.speech_text(index)
+
+    def to_full(self) -> dict:
+        """Return the report in the default (non-compact) format."""
+        if not self.compact:
+            return self.report
+
+        report_dict = {k: v for k, v in self.report.items() if k != "format"}
+        report_dict["by_speaker"] = [self[i] for i in range(len(self))]
+        return report_dict
@@ -0,0 +1,166 @@
+"""
+Durable work queue in a SQLite file, shared by worker processes on one or
+more nodes.
+
+On a local disk the queue uses SQLite's WAL journal, which needs shared
+memory between the processes and so only works on one node. A queue on a
+shared disk (NFS, SMB) must be opened with shared_disk=True by every
+process: it then uses the rollback journal, whose file locks work across
+nodes as long as the network file system implements POSIX locks.
+
+Tasks are identified by (kind, key), e.g. ("download", "S/PV.9000"), and
+carry a JSON payload. A worker leases a task for `lease_seconds` and then
+marks it completed or failed. Failed tasks and tasks whose lease expired
+(the worker died) go back to pending until they have been attempted
+`max_attempts` times. Adding a task that already exists is a no-op, so
+discovering the same meeting twice queues it once.
+"""
+from pathlib import Path
+import json
+import sqlite3
+import time
+from io_utils import BUSY_TIMEOUT
+
+QUEUE_FILE = "work_queue.sqlite"
+LEASE_SECONDS = 600
+MAX_ATTEMPTS = 3
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+class WorkQueue:
+    def __init__(
+        self,
+        path: str | Path = QUEUE_FILE,
+        lease_seconds: float = LEASE_SECONDS,
+        max_attempts: int = MAX_ATTEMPTS,
+        shared_disk: bool = False,
+    ):
+        self.path = Path(path)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+        self.db = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+        journal_mode = "DELETE" if shared_disk else "WAL"
+        self.db.execute(f"PRAGMA journal_mode={journal_mode}")
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tasks (
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                owner TEXT,
+                lease_expires REAL,
+                error TEXT,
+                PRIMARY KEY (kind, key)
+            )
+            """
+        )
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS tasks_status ON tasks (kind, status)"
+        )
+
+    def put(self, kind: str, key: str, payload: dict) -> bool:
+        """Queue a task, returning False if (kind, key) was queued before."""
+        cursor = self.db.execute(
+            "INSERT OR IGNORE INTO tasks (kind, key, payload) VALUES (?, ?, ?)",
+            (kind, key, json.dumps(payload, ensure_ascii=False)),
+        )
+        return cursor.rowcount == 1
+
+    def lease(self, kind: str, owner: str) -> dict | None:
+        """Lease the oldest pending (or expired) task of `kind`, if any."""
+        now = time.time()
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            # Expired leases of tasks out of attempts are given up
+            self.db.execute(
+                "UPDATE tasks SET status = ?, error = 'lease expired' "
+                "WHERE kind = ? AND status = ? AND lease_expires < ? "
+                "AND attempts >= ?",
+                (FAILED, kind, LEASED, now, self.max_attempts),
+            )
+            row = self.db.execute(
+                "SELECT rowid, key, payload, attempts FROM tasks "
+                "WHERE kind = ? AND (status = ? OR (status = ? AND lease_expires < ?)) "
+                "ORDER BY rowid LIMIT 1",
+                (kind, PENDING, LEASED, now),
+            ).fetchone()
+
+            if row is None:
+                self.db.execute("COMMIT")
+                return None
+
+            rowid, key, payload, attempts = row
+            self.db.execute(
+                "UPDATE tasks SET status = ?, owner = ?, lease_expires = ?, "
+                "attempts = attempts + 1 WHERE rowid = ?",
+                (LEASED, owner, now + self.lease_seconds, rowid),
+            )
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+
+        return {
+            "kind": kind,
+            "key": key,
+            "payload": json.loads(payload),
+            "attempts": attempts + 1,
+            "owner": owner,
+        }
+
+    def complete(self, task: dict) -> bool:
+        """Mark a leased task done; False if the lease was lost meanwhile."""
+        cursor = self.db.execute(
+            "UPDATE tasks SET status = ?, lease_expires = NULL, error = NULL "
+            "WHERE kind = ? AND key = ? AND status = ? AND owner = ?",
+            (DONE, task["kind"], task["key"], LEASED, task["owner"]),
+        )
+        return cursor.rowcount == 1
+
+    def fail(self, task: dict, error: str) -> bool:
+        """Release a leased task for a retry, or fail it once out of attempts."""
+        status = FAILED if task["attempts"] >= self.max_attempts else PENDING
+        cursor = self.db.execute(
+            "UPDATE tasks SET status = ?, lease_expires = NULL, error = ? "
+            "WHERE kind = ? AND key = ? AND status = ? AND owner = ?",
+            (status, error, task["kind"], task["key"], LEASED, task["owner"]),
+        )
+        return cursor.rowcount == 1
+
+    def counts(self, kind: str | None = None) -> dict[str, int]:
+        """Number of tasks per status, for one kind or all."""
+        query = "SELECT status, COUNT(*) FROM tasks"
+        params = ()
+        if kind is not None:
+            query += " WHERE kind = ?"
+            params = (kind,)
+        return dict(self.db.execute(query + " GROUP BY status", params).fetchall())
+
+    def is_drained(self, kinds: list[str]) -> bool:
+        """True if no task of `kinds` is pending or leased."""
+        placeholders = ",".join("?" * len(kinds))
+        row = self.db.execute(
+            f"SELECT COUNT(*) FROM tasks WHERE kind IN ({placeholders}) "
+            "AND status IN (?, ?)",
+            (*kinds, PENDING, LEASED),
+        ).fetchone()
+        return row[0] == 0
+
+    def failed(self, kind: str) -> dict[str, str]:
+        """Key -> error of every failed task of `kind`."""
+        return dict(
+            self.db.execute(
+                "SELECT key, error FROM tasks WHERE kind = ? AND status = ?",
+                (kind, FAILED),
+            ).fetchall()
+        )
+
+    def close(self) -> None:
+        self.db.close()